@@ -0,0 +1,160 @@
+# bench/bench_dashboard.py
+# Micro-benchmark for the stream.py refresh path on synthetic data.
+#
+#   python bench/bench_dashboard.py                 # history sizes 1k,10k,100k
+#   python bench/bench_dashboard.py --rows 2000 --sizes 1000,50000
+#
+# "legacy" is the old get_last_change (filter + sort of the whole history
+# for every competitor on every card); "table" is one build_last_changes
+# pass per history load followed by dict lookups.
+#
+# Before timing anything it re-runs the parity checks from
+# tests/test_dashboard_data.py (vectorized column helpers vs the scalar
+# functions) on the synthetic sheet.
+#
+# The second table times one stream.py refresh at 1k / 10k / 100k sheet
+# rows: the full reload (frame + SKU index + locations + search index),
+# applying a batch of feed events, and a first (uncached) search.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from dashboard_data import (SKU_COLUMNS, clean_sku_text, sheet_frame, history_frame, build_last_changes,
+                            build_sku_index, build_sku_locations, apply_events, SearchIndex)
+from tests.test_dashboard_data import SKU_CASES, PRICE_CASES, assert_sku_parity, assert_price_parity
+
+HISTORY_HEADER = ["SKU", "Old Price", "New Price", "Change", "DateTime"]
+
+
+def make_sheet(rows, seed=1):
+    rnd = random.Random(seed)
+    header = SKU_COLUMNS + [f"Price{i}" for i in range(1, 7)] + [f"Nudge{i}" for i in range(1, 7)] \
+        + ["Last Updated", "ProductName", "Image url"]
+    data = [header]
+    for r in range(rows):
+        skus = [f"N{rnd.randrange(10**9):09d}A" for _ in range(6)]
+        prices = [f"{rnd.uniform(20, 900):.2f}" for _ in range(6)]
+        nudges = [rnd.choice(["-", "Sold recently 50+", "Only 2 left"]) for _ in range(6)]
+        data.append(skus + prices + nudges + ["2026-01-01 00:00:00", f"Product {r}", ""])
+    return data
+
+
+def make_history(sheet_data, size, seed=2):
+    rnd = random.Random(seed)
+    skus = [sku for row in sheet_data[1:] for sku in row[:6]]
+    start = pd.Timestamp("2024-01-01").value // 10**9
+    rows = []
+    # unique timestamps, so "last change" has no ties to break differently
+    for offset in rnd.sample(range(3 * 365 * 86400), size):
+        old = rnd.uniform(20, 900)
+        new = old * rnd.uniform(0.8, 1.2)
+        ts = pd.Timestamp(start + offset, unit="s")
+        rows.append([rnd.choice(skus), f"{old:.2f}", f"{new:.2f}", f"{new - old:.2f}",
+                     ts.strftime("%Y-%m-%d %H:%M:%S")])
+    return rows
+
+
+def legacy_get_last_change(hist, sku):
+    if hist.empty:return None
+    s=clean_sku_text(sku).lower()
+    r=hist[hist["SKU_lower"]==s]
+    if r.empty:return None
+    r=r.sort_values("DateTime")
+    last=r.iloc[-1]
+    return {"old":last["Old Price"],"new":last["New Price"],"time":str(last["DateTime"])}
+
+
+def competitor_skus(df):
+    """The SKUs one refresh asks for: competitors on every card + 10 notifications."""
+    out = [row[f"SKU{i}_clean"] for _, row in df.iterrows() for i in range(2, 7) if row[f"SKU{i}_clean"]]
+    return out + out[:50]
+
+
+def check_parity(sheet_data):
+    """Vectorized column helpers must match the scalar functions exactly."""
+    n_skus = assert_sku_parity(SKU_CASES + [cell for row in sheet_data[1:200] for cell in row[:6]])
+    n_prices = assert_price_parity(PRICE_CASES + [cell for row in sheet_data[1:200] for cell in row[6:12]])
+    print(f"parity ok: {n_skus} SKU cells, {n_prices} price cells")
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def make_events(sheet_data, n, seed=4):
+    """Feed rows as PriceStore.events_since returns them."""
+    rnd = random.Random(seed)
+    skus = [sku for row in sheet_data[1:] for sku in row[:6]]
+    return [(seq, time.time(), rnd.choice(skus), rnd.choice(["price", "price", "nudge"]),
+             None, f"{rnd.uniform(20, 900):.2f}") for seq in range(1, n + 1)]
+
+
+def bench_refresh(sizes, events):
+    print(f"{'sheet rows':>10} {'reload s':>10} {'feed s':>10} {'search s':>10}")
+    for rows in sizes:
+        data = make_sheet(rows)
+        feed = make_events(data, events)
+        query = data[1 + rows // 2][0][2:7].lower()
+
+        def reload():
+            df = sheet_frame(data)
+            return df, build_sku_index(df), build_sku_locations(df), SearchIndex(df)
+
+        reload_s, (df, _, locations, search) = timed(reload)
+        feed_s, _ = timed(lambda: apply_events(df, locations, feed))
+        search_s, _ = timed(lambda: (search.search(query), search.search(query, "prefix")))
+        print(f"{rows:>10} {reload_s:>10.3f} {feed_s:>10.3f} {search_s:>10.3f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=500, help="rows in the noon sheet")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="history sizes to test")
+    ap.add_argument("--legacy-max", type=int, default=100000,
+                    help="skip the legacy path above this history size")
+    ap.add_argument("--refresh-sizes", default="1000,10000,100000",
+                    help="sheet sizes for the refresh-path table (empty to skip)")
+    ap.add_argument("--events", type=int, default=500, help="feed events applied per refresh")
+    args = ap.parse_args()
+
+    sheet_data = make_sheet(args.rows)
+    check_parity(sheet_data)
+    df = sheet_frame(sheet_data)
+    lookups = competitor_skus(df)
+    print(f"sheet rows={args.rows} lookups per refresh={len(lookups)}")
+    print(f"{'history':>10} {'legacy s':>10} {'build s':>10} {'lookup s':>10} {'speedup':>9}")
+
+    for size in [int(x) for x in args.sizes.split(",")]:
+        hist = history_frame(HISTORY_HEADER, make_history(sheet_data, size))
+
+        build, table = timed(lambda: build_last_changes(hist))
+        lookup, fast = timed(lambda: [table.get(clean_sku_text(s).lower()) for s in lookups])
+
+        if size <= args.legacy_max:
+            legacy, slow = timed(lambda: [legacy_get_last_change(hist, s) for s in lookups])
+            keys = ("old", "new", "time")
+            assert slow == [c and {k: c[k] for k in keys} for c in fast], \
+                "build_last_changes disagrees with the legacy lookup"
+            speedup = f"{legacy / (build + lookup):.0f}x"
+            legacy = f"{legacy:.3f}"
+        else:
+            legacy, speedup = "skipped", "-"
+
+        print(f"{size:>10} {legacy:>10} {build:>10.3f} {lookup:>10.3f} {speedup:>9}")
+
+    if args.refresh_sizes:
+        print()
+        bench_refresh([int(x) for x in args.refresh_sizes.split(",")], args.events)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+# bench/bench_scraper.py
+# Offline end-to-end benchmark of the scraper: a local HTTP server serves the
+# product pages from fixtures/ (with latency, errors and block pages), and an
+# in-memory stand-in replaces the gspread spreadsheet. monitor_loop runs
+# unchanged against both.
+#
+#   python bench/bench_scraper.py                          # 300 SKUs, 1 cycle, HTTP path
+#   python bench/bench_scraper.py --skus 2000 --concurrency 8 --cycles 3
+#   python bench/bench_scraper.py --mode auto --error-rate 0.05   # errors fall back to Chromium
+#   python bench/bench_scraper.py --workers 4 --skus 2000   # coordinator + 4 worker processes
+#
+# Reports SKUs/min, p50/p95/p99 per-SKU fetch latency, Sheets calls per
+# cycle and peak RSS (this process + children, e.g. Chromium).
+
+import argparse
+import importlib.util
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+FIXTURES = os.path.join(ROOT, "fixtures")
+SCRAPER_FILE = os.path.join(ROOT, "python noon_scraper_playwright.py")
+
+
+# ==========================================
+# Mock noon.com
+# ==========================================
+
+def load_templates():
+    """Fixture pages with the price replaced by a {price} placeholder."""
+    def read(name):
+        with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+            return f.read()
+
+    rendered = read("product_rendered.html")
+    rendered = rendered.replace(">139.00<", ">{price}<").replace('"price":"149.00"', '"price":"{price}"')
+    json_only = re.sub(r'"sale_price":[\d.]+', '"sale_price":{price}', read("product_json_only.html"))
+    return [rendered, json_only], read("blocked.html")
+
+
+class MockNoon:
+    """Serves /<locale>/<sku>/p/ with per-SKU prices that move at `change_rate`."""
+
+    def __init__(self, latency_ms, jitter_ms, error_rate, block_rate, change_rate, seed=1):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.change_rate = change_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.prices = {}
+        self.pages, self.blocked = load_templates()
+        self.hits = {"ok": 0, "error": 0, "blocked": 0}
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mock.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/saudi-en"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, req):
+        parts = [p for p in req.path.split("/") if p]
+        sku = parts[1] if len(parts) >= 3 else ""
+        with self.lock:
+            roll = self.rnd.random()
+            delay = max(0.0, self.latency + self.rnd.uniform(-self.jitter, self.jitter))
+            price = self.prices.get(sku) or round(self.rnd.uniform(20, 900), 2)
+            if self.rnd.random() < self.change_rate:
+                price = round(price * self.rnd.uniform(0.85, 1.15), 2)
+            self.prices[sku] = price
+        time.sleep(delay)
+
+        if not sku or roll < self.error_rate:
+            status, body, kind = 500, "error", "error"
+        elif roll < self.error_rate + self.block_rate:
+            status, body, kind = 200, self.blocked, "blocked"
+        else:
+            page = self.pages[sum(map(ord, sku)) % len(self.pages)]
+            status, body, kind = 200, page.replace("{price}", f"{price:.2f}"), "ok"
+        with self.lock:
+            self.hits[kind] += 1
+
+        data = body.encode("utf-8")
+        req.send_response(status)
+        req.send_header("Content-Type", "text/html; charset=utf-8")
+        req.send_header("Content-Length", str(len(data)))
+        req.end_headers()
+        req.wfile.write(data)
+
+
+# ==========================================
+# In-memory gspread stand-in
+# ==========================================
+
+class CallCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def note(self, op):
+        with self.lock:
+            self.counts[op] = self.counts.get(op, 0) + 1
+
+    def pop(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+
+class FakeWorksheet:
+    """The subset of gspread.Worksheet the scraper and dashboard use."""
+
+    def __init__(self, title, values, counter):
+        self.title = title
+        self.values = values
+        self.counter = counter
+        self.lock = threading.Lock()
+
+    def get_all_values(self):
+        self.counter.note("get_all_values")
+        with self.lock:
+            return [list(r) for r in self.values]
+
+    def batch_get(self, ranges):
+        self.counter.note("batch_get")
+        with self.lock:
+            out = []
+            for rng in ranges:
+                start, _, end = rng.partition(":")
+                r1, _ = a1_to_rowcol(re.sub(r"^([A-Z]+)$", r"\g<1>1", start))
+                r2 = int(re.sub(r"\D", "", end) or len(self.values)) if end else r1
+                out.append([list(r) for r in self.values[r1 - 1:r2]])
+            return out
+
+    def batch_update(self, data, value_input_option=None):
+        self.counter.note("batch_update")
+        with self.lock:
+            for item in data:
+                r, c = a1_to_rowcol(item["range"])
+                while len(self.values) < r:
+                    self.values.append([])
+                row = self.values[r - 1]
+                row += [""] * (c - len(row))
+                row[c - 1] = str(item["values"][0][0])
+
+    def append_rows(self, rows, value_input_option=None):
+        self.counter.note("append_rows")
+        with self.lock:
+            self.values.extend([str(v) for v in r] for r in rows)
+
+    def append_row(self, row, value_input_option=None):
+        self.counter.note("append_row")
+        with self.lock:
+            self.values.append([str(v) for v in row])
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets, counter):
+        self.sheets = sheets
+        self.counter = counter
+
+    def worksheet(self, name):
+        self.counter.note("worksheet")
+        if name not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(name)
+        return self.sheets[name]
+
+    def add_worksheet(self, name, rows, cols):
+        self.counter.note("add_worksheet")
+        self.sheets[name] = FakeWorksheet(name, [], self.counter)
+        return self.sheets[name]
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        self.spreadsheet.counter.note("open_by_key")
+        return self.spreadsheet
+
+
+def make_noon_sheet(skus, seed=3):
+    """Sheet rows in the scraper's layout: SKU1..6, Price1..6, Nudge1..6, Last Updated."""
+    rnd = random.Random(seed)
+    header = [f"SKU{i}" for i in range(1, 7)] + [f"Price{i}" for i in range(1, 7)] \
+        + [f"Nudge{i}" for i in range(1, 7)] + ["Last Updated", "ProductName", "Image url"]
+    codes = [f"N{rnd.randrange(10**9):09d}A" for _ in range(skus)]
+    rows = [header]
+    for start in range(0, len(codes), 6):
+        chunk = codes[start:start + 6]
+        rows.append(chunk + [""] * (6 - len(chunk)) + [""] * 13 + [f"Product {start // 6}", ""])
+    return rows
+
+
+# ==========================================
+# Measurement
+# ==========================================
+
+class RssSampler:
+    """Peak RSS (MB) of this process plus its children, sampled in the background."""
+
+    def __init__(self, every=0.2):
+        self.every = every
+        self.peak = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        if psutil is None:
+            return 0.0
+        me = psutil.Process()
+        total = me.memory_info().rss
+        for child in me.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / 2 ** 20
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, self.sample())
+            self.stopped.wait(self.every)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.sample())
+        if psutil is None:
+            # ru_maxrss is KB on Linux, bytes on macOS; no children either way
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def load_scraper(env):
+    """Import the scraper script (its file name has a space) after setting its env."""
+    os.environ.update(env)
+    spec = importlib.util.spec_from_file_location("noon_scraper_bench", SCRAPER_FILE)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="noon-bench-")
+    counter = CallCounter()
+    spreadsheet = FakeSpreadsheet({
+        "noon": FakeWorksheet("noon", make_noon_sheet(args.skus), counter),
+        "history": FakeWorksheet("history", [["SKU", "Old Price", "New Price", "Change", "DateTime"]], counter),
+    }, counter)
+
+    with MockNoon(args.latency_ms, args.jitter_ms, args.error_rate, args.block_rate, args.change_rate) as mock:
+        env = {
+            "NOON_BASE_URL": mock.base_url,
+            "NOON_FETCH_MODE": args.mode,
+            "NOON_CONCURRENCY": str(args.concurrency),
+            "NOON_HOST_DELAY_SEC": str(args.host_delay),
+            "NOON_BLOCK_BACKOFF_SEC": str(args.block_backoff),
+            "NOON_QUEUE_FILE": os.path.join(workdir, "noon_queue.db"),
+        }
+        mod = load_scraper(dict(env, **{
+            "NOON_ROLE": "coordinator" if args.workers else "standalone",
+            "NOON_DB_FILE": os.path.join(workdir, "noon_prices.db"),
+            "NOON_HISTORY_SPOOL": os.path.join(workdir, "history_spool.jsonl"),
+        }))
+
+        class OfflineGateway(mod.SheetsGateway):
+            @classmethod
+            def from_service_file(cls, path, **kwargs):
+                gw = cls(None, per_min=10 ** 6)
+                gw._client = FakeClient(spreadsheet)
+                return gw
+
+        latencies = []
+        fetched = [0]
+        lat_lock = threading.Lock()
+        fetch_sku = mod.fetch_sku
+        dispatch_map = mod.QueueDispatch.map
+
+        def counted_map(self, jobs):
+            for result in dispatch_map(self, jobs):
+                with lat_lock:
+                    fetched[0] += 1
+                yield result
+
+        def timed_fetch_sku(slot, sku, *rest):
+            t = time.perf_counter()
+            try:
+                return fetch_sku(slot, sku, *rest)
+            finally:
+                with lat_lock:
+                    latencies.append(time.perf_counter() - t)
+
+        cycles = []
+        log = mod.log
+
+        def bench_log(msg):
+            if args.verbose:
+                log(msg)
+            if msg.startswith("🔄"):
+                counter.pop()
+                with lat_lock:
+                    del latencies[:]
+                    fetched[0] = 0
+                cycles.append({"start": time.perf_counter()})
+            elif msg.startswith("⏳") and cycles:
+                cur = cycles[-1]
+                cur["sec"] = time.perf_counter() - cur["start"]
+                cur["calls"] = counter.pop()
+                with lat_lock:
+                    cur["latencies"] = list(latencies)
+                    cur["skus"] = fetched[0] if args.workers else len(latencies)
+                if len(cycles) >= args.cycles:
+                    mod.STOP = True
+
+        mod.SheetsGateway = OfflineGateway
+        mod.fetch_sku = timed_fetch_sku
+        mod.QueueDispatch.map = counted_map
+        mod.log = bench_log
+        mod.HOST_DELAY_SEC = args.host_delay
+        mod.BLOCK_BACKOFF_SEC = args.block_backoff
+        # every SKU due on every cycle
+        mod.MAX_INTERVAL_MIN = mod.OWN_MAX_INTERVAL_MIN = 0.001
+
+        workers = [
+            subprocess.Popen([sys.executable, SCRAPER_FILE], env=dict(os.environ, NOON_ROLE="worker", **env),
+                             stdout=None if args.verbose else subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            for _ in range(args.workers)
+        ]
+        try:
+            with RssSampler() as rss:
+                mod.monitor_loop("offline.json", "offline", "noon", 0.001, concurrency=args.concurrency)
+        finally:
+            for proc in workers:
+                proc.terminate()
+            for proc in workers:
+                proc.wait(timeout=60)
+
+    done = [c for c in cycles if "sec" in c]
+    procs = f"{args.workers} worker processes × " if args.workers else ""
+    print(f"SKUs: {args.skus} | {procs}concurrency {args.concurrency} | mode {args.mode} | "
+          f"latency {args.latency_ms}±{args.jitter_ms} ms | errors {args.error_rate:.0%} | blocks {args.block_rate:.0%}")
+    print(f"server responses: {mock.hits}")
+    print(f"{'cycle':>5} {'sec':>8} {'SKUs/min':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  sheets calls")
+    for n, c in enumerate(done, 1):
+        lat = [x * 1000 for x in c["latencies"]]
+        rate = c["skus"] / c["sec"] * 60 if c["sec"] else 0
+        calls = sum(c["calls"].values())
+        detail = ", ".join(f"{k}={v}" for k, v in sorted(c["calls"].items()))
+        print(f"{n:>5} {c['sec']:>8.2f} {rate:>10.0f} {percentile(lat, 50):>8.1f} "
+              f"{percentile(lat, 95):>8.1f} {percentile(lat, 99):>8.1f}  {calls} ({detail})")
+    print(f"history rows written: {len(spreadsheet.sheets['history'].values) - 1}")
+    print(f"peak RSS: {rss.peak:.0f} MB" + ("" if psutil else " (this process only; install psutil for children)"))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--skus", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=3)
+    ap.add_argument("--cycles", type=int, default=1)
+    ap.add_argument("--workers", type=int, default=0,
+                    help="run as coordinator with this many NOON_ROLE=worker processes (latency is then not measured)")
+    ap.add_argument("--mode", choices=["http", "auto", "browser"], default="http",
+                    help="NOON_FETCH_MODE for the run (auto/browser need Chromium)")
+    ap.add_argument("--latency-ms", type=float, default=150)
+    ap.add_argument("--jitter-ms", type=float, default=50)
+    ap.add_argument("--error-rate", type=float, default=0.02, help="share of HTTP 500 responses")
+    ap.add_argument("--block-rate", type=float, default=0.01, help="share of captcha pages")
+    ap.add_argument("--change-rate", type=float, default=0.1, help="chance a SKU's price moves per request")
+    ap.add_argument("--host-delay", type=float, default=0.0, help="NOON_HOST_DELAY_SEC (0 = no spacing)")
+    ap.add_argument("--block-backoff", type=float, default=0.0,
+                    help="NOON_BLOCK_BACKOFF_SEC (the mock's block pages are random, so 0 by default)")
+    ap.add_argument("--verbose", action="store_true", help="show the scraper's own log")
+    run(ap.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# dashboard_data.py
+# Pure pandas helpers for stream.py (no Streamlit import), so the data
+# side of the dashboard can be reused and benchmarked outside `streamlit run`.
+
+import datetime
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+SKU_COLUMNS=["SKU1","SKU2","SKU3","SKU4","SKU5","SKU6"]
+
+# -------------------------------------------------
+# تنظيف SKU
+# -------------------------------------------------
+def clean_sku_text(x):
+    if not x:
+        return ""
+    x=str(x).strip()
+    x=re.sub(r"[\u200B-\u200F\u202A-\u202E\uFEFF]","",x)
+    m=re.search(r"\(([A-Za-z0-9]+)\)",x)
+    if m:
+        return m.group(1)
+    parts=re.findall(r"[A-Za-z0-9]{6,}",x)
+    if parts:
+        return max(parts,key=len)
+    return x
+
+# -------------------------------------------------
+# Price to float
+# -------------------------------------------------
+def price_to_float(s):
+    if s is None:return None
+    s=str(s).strip().replace(",",".")
+    s=re.sub(r"[^\d\.\-]","",s)
+    try:return float(s)
+    except:return None
+
+# -------------------------------------------------
+# نفس الدالتين على عمود كامل مرة واحدة (pandas .str بدل apply)
+# -------------------------------------------------
+def clean_sku_series(s):
+    """Vectorized clean_sku_text: same result for every element.
+
+    Cells that are already a single 6+ character token (the usual case)
+    are resolved with one fullmatch; only the rest go through the
+    "(SKU)" extraction and the longest-token fallback."""
+    if s.empty:
+        return s.astype(object)
+    s=s.fillna("").astype(str).str.strip()
+    s=s.str.replace(r"[\u200B-\u200F\u202A-\u202E\uFEFF]","",regex=True)
+    out=s.where(s.str.fullmatch(r"[A-Za-z0-9]{6,}"))
+
+    todo=out.isna()&(s!="")
+    if todo.any():
+        rest=s[todo]
+        found=rest.str.extract(r"\(([A-Za-z0-9]+)\)",expand=False)
+        # أطول مقطع (6+ حروف/أرقام)، والأول عند التساوي مثل max()
+        need=found.isna()
+        if need.any():
+            found[need]=rest[need].str.findall(r"[A-Za-z0-9]{6,}").map(lambda t:max(t,key=len) if t else None)
+        out[todo]=found
+
+    return out.fillna(s)
+
+def price_series(s):
+    """Vectorized price_to_float: float column, NaN where it returns None."""
+    txt=s.fillna("").astype(str).str.strip().str.replace(",",".",regex=False)
+    txt=txt.str.replace(r"[^\d\.\-]","",regex=True)
+    num=pd.to_numeric(txt,errors="coerce").astype(float)
+
+    # float() accepts a few forms to_numeric doesn't (e.g. Arabic-Indic digits)
+    retry=num.isna()&(txt!="")
+    if retry.any():
+        num[retry]=txt[retry].map(lambda x:price_to_float(x)).astype(float)
+    return num
+
+# -------------------------------------------------
+# تحويل قيم الشيت إلى DataFrame
+# -------------------------------------------------
+def pad_row(row,width):
+    row=list(row)[:width]
+    return row+[""]*(width-len(row))
+
+def sheet_frame(data):
+    """Sheet values → DataFrame with typed SKU{i}_clean / Price{i}_num columns."""
+    df=pd.DataFrame(data[1:],columns=data[0])
+
+    for i in range(1,7):
+        if f"SKU{i}" in df:
+            df[f"SKU{i}_clean"]=clean_sku_series(df[f"SKU{i}"])
+        if f"Price{i}" in df:
+            df[f"Price{i}_num"]=price_series(df[f"Price{i}"])
+
+    return df
+
+def history_frame(header,rows):
+    df=pd.DataFrame([pad_row(r,len(header)) for r in rows],columns=header)
+    df["SKU_clean"]=clean_sku_series(df["SKU"])
+    df["SKU_lower"]=df["SKU_clean"].str.lower()
+    df["Old Price_num"]=price_series(df["Old Price"])
+    df["New Price_num"]=price_series(df["New Price"])
+    df["DateTime"]=pd.to_datetime(df["DateTime"],errors="coerce")
+    return df
+
+# -------------------------------------------------
+# فهرس SKU → صف (يُبنى مرة واحدة لكل تحميل للشيت)
+# -------------------------------------------------
+def build_sku_index(df):
+    """{clean sku: (row position, slot 1..6)} — first row / first slot wins,
+    same as scanning the rows in order. Reads the SKU{i}_clean columns."""
+    cols=[c+"_clean" for c in SKU_COLUMNS if c+"_clean" in df.columns]
+    if df.empty or not cols:
+        return {}
+    vals=df[cols].to_numpy().ravel()
+    pos=np.repeat(np.arange(len(df)),len(cols))
+    slot=np.tile([int(c[3]) for c in cols],len(df))
+    keep=(vals!="")&~pd.Series(vals).duplicated().to_numpy()
+    return dict(zip(vals[keep].tolist(),zip(pos[keep].tolist(),slot[keep].tolist())))
+
+def build_sku_locations(df):
+    """{sku lower: [(row position, slot 1..6), ...]} — every cell a SKU
+    appears in, so a feed event can be applied to all of them."""
+    cols=[c+"_clean" for c in SKU_COLUMNS if c+"_clean" in df.columns]
+    out={}
+    if df.empty or not cols:
+        return out
+    vals=df[cols].to_numpy().ravel()
+    pos=np.repeat(np.arange(len(df)),len(cols))
+    slot=np.tile([int(c[3]) for c in cols],len(df))
+    keep=vals!=""
+    for v,p,sl in zip(vals[keep].tolist(),pos[keep].tolist(),slot[keep].tolist()):
+        out.setdefault(v.lower(),[]).append((p,sl))
+    return out
+
+# -------------------------------------------------
+# تغذية التغييرات من قاعدة السكرابر (price_store.py)
+# -------------------------------------------------
+HISTORY_HEADER=["SKU","Old Price","New Price","Change","DateTime"]
+
+def format_price(v):
+    """Store value → the text the sheet shows for it (149.0 → "149")."""
+    f=price_to_float(v)
+    if f is None:
+        return "" if v is None else str(v)
+    return str(int(f)) if f==int(f) else str(f)
+
+def store_history_frame(rows):
+    """changes_since() rows → the same frame history_frame builds from the sheet."""
+    out=[]
+    for _,sku,ts,old,new in rows:
+        change=""
+        if old is not None and new is not None:
+            change=format_price(new-old)
+        out.append([sku,format_price(old),format_price(new),change,
+                    pd.Timestamp.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")])
+    return history_frame(HISTORY_HEADER,out)
+
+def last_changes_table(changes):
+    """{sku: (ts, old, new)} from history_archive.last_changes() or
+    PriceStore.last_changes() → the build_last_changes table format."""
+    out={}
+    for sku,(ts,old,new) in changes.items():
+        out[sku.lower()]={"old":format_price(old),"new":format_price(new),"old_num":old,"new_num":new,
+                          "time":pd.Timestamp.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")}
+    return out
+
+def merge_last_changes(last,newer):
+    """Copy of `last` updated with the entries of `newer` that are not older."""
+    out=dict(last)
+    for k,v in newer.items():
+        cur=out.get(k)
+        if cur is None or cur["time"]=="NaT" or v["time"]>=cur["time"]:
+            out[k]=v
+    return out
+
+def apply_events(df,locations,events):
+    """Copy of the sheet frame with feed events applied; returns (df, cells touched).
+
+    "price" events set Price{slot} / Price{slot}_num, "nudge" events set
+    Nudge{slot}, at every location of the SKU."""
+    df=df.copy()
+    touched=0
+    for _,_,sku,kind,_,new in events:
+        for pos,slot in locations.get(clean_sku_text(sku).lower(),[]):
+            if kind=="price" and f"Price{slot}" in df.columns:
+                df.iat[pos,df.columns.get_loc(f"Price{slot}")]=format_price(new)
+                if f"Price{slot}_num" in df.columns:
+                    num=price_to_float(new)
+                    df.iat[pos,df.columns.get_loc(f"Price{slot}_num")]=float("nan") if num is None else num
+                touched+=1
+            elif kind=="nudge" and f"Nudge{slot}" in df.columns:
+                df.iat[pos,df.columns.get_loc(f"Nudge{slot}")]="" if new is None else new
+                touched+=1
+    return df,touched
+
+def latest_events(latest):
+    """PriceStore.latest_prices() rows → apply_events events setting each SKU's newest price and nudges."""
+    out=[]
+    for sku,ts,price,nudges in latest:
+        out.append((0,ts,sku,"price",None,None if price is None else str(price)))
+        out.append((0,ts,sku,"nudge",None,nudges))
+    return out
+
+# -------------------------------------------------
+# آخر تغيير لكل SKU (يُبنى مرة واحدة لكل تحميل للـ history)
+# -------------------------------------------------
+def build_last_changes(hist):
+    """{sku lower: {"old","new","old_num","new_num","time"}} — the row a
+    per-SKU sort_values("DateTime").iloc[-1] would pick (NaT sorts last)."""
+    if hist.empty:
+        return {}
+    h=hist.sort_values("DateTime",kind="mergesort")
+    last=h.drop_duplicates("SKU_lower",keep="last")
+    return {
+        s:{"old":o,"new":n,"old_num":on,"new_num":nn,"time":str(t)}
+        for s,o,n,on,nn,t in zip(last["SKU_lower"],last["Old Price"],last["New Price"],
+                                 last["Old Price_num"],last["New Price_num"],last["DateTime"])
+    }
+
+# -------------------------------------------------
+# فهرس البحث (يُبنى مرة واحدة لكل تحميل للشيت)
+# -------------------------------------------------
+class SearchIndex:
+    """Search over the SKU columns (raw + clean) and ProductName.
+
+    Each row gets one lowercase key, so a query is a single vectorized
+    str.contains over one column: plain substring, or "prefix" (the query
+    starts a word). Results (row positions) are cached per query until
+    the next load.
+    """
+
+    MAX_CACHED=256
+    SEP="\x1f"
+
+    def __init__(self,df):
+        cols=[c for c in SKU_COLUMNS+[c+"_clean" for c in SKU_COLUMNS]+["ProductName"] if c in df.columns]
+        keys=pd.Series([""]*len(df),dtype=object)
+        for c in cols:
+            keys=keys+self.SEP+df[c].fillna("").astype(str).to_numpy()
+        self.keys=keys.str.lower()
+
+        self.lock=threading.Lock()
+        self.results=OrderedDict()
+
+    def search(self,query,mode="substring"):
+        """Row positions matching `query` ("substring" or word "prefix"), None for an empty query."""
+        q=str(query or "").strip().lower()
+        if not q:
+            return None
+        key=(mode,q)
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+
+        if mode=="prefix":
+            hits=self.keys.str.contains(r"(?<!\w)"+re.escape(q),regex=True)
+        else:
+            hits=self.keys.str.contains(q,regex=False)
+        rows=np.flatnonzero(hits.to_numpy())
+
+        with self.lock:
+            self.results[key]=rows
+            while len(self.results)>self.MAX_CACHED:
+                self.results.popitem(last=False)
+        return rows
+
+# -------------------------------------------------
+# سلاسل الأسعار لكل SKU (للرسوم البيانية)
+# -------------------------------------------------
+class PriceSeriesCache:
+    """Per-SKU price history as sorted numpy arrays (naive local time in ns, price).
+
+    Each change contributes (time, new price); a SKU's first change also
+    contributes its old price one second earlier. add() merges new rows
+    in place (append when they are newer, re-sort otherwise), so the
+    cache is built once and then follows the history loads.
+    """
+
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.series={}
+
+    def __len__(self):
+        return len(self.series)
+
+    def add(self,skus,ts,old,new):
+        """Arrays of lowercase SKU, time (int64 ns), old and new price."""
+        if not len(skus):
+            return
+        skus=np.asarray(skus,dtype=object)
+        order=np.lexsort((ts,skus))
+        skus,ts,old,new=skus[order],np.asarray(ts)[order],np.asarray(old,float)[order],np.asarray(new,float)[order]
+        starts=np.flatnonzero(np.r_[True,skus[1:]!=skus[:-1]])
+        ends=np.r_[starts[1:],len(skus)]
+
+        with self.lock:
+            for a,b in zip(starts.tolist(),ends.tolist()):
+                sku=skus[a]
+                t,p=ts[a:b],new[a:b]
+                cur=self.series.get(sku)
+                if cur is None and not np.isnan(old[a]):
+                    t=np.r_[t[0]-10**9,t]
+                    p=np.r_[old[a],p]
+                keep=~np.isnan(p)
+                t,p=t[keep],p[keep]
+                if cur is not None:
+                    if len(cur[0]) and len(t) and t[0]<cur[0][-1]:
+                        t=np.r_[cur[0],t]
+                        p=np.r_[cur[1],p]
+                        o=np.argsort(t,kind="mergesort")
+                        t,p=t[o],p[o]
+                        dup=np.r_[False,(t[1:]==t[:-1])&(p[1:]==p[:-1])]
+                        t,p=t[~dup],p[~dup]
+                    else:
+                        t=np.r_[cur[0],t]
+                        p=np.r_[cur[1],p]
+                if len(t):
+                    self.series[sku]=(t.astype(np.int64),p)
+
+    def add_frame(self,hist):
+        """Rows of a history_frame (rows without a DateTime are skipped)."""
+        if hist.empty:
+            return
+        h=hist[hist["DateTime"].notna()]
+        self.add(h["SKU_lower"].to_numpy(),h["DateTime"].to_numpy("datetime64[ns]").astype(np.int64),
+                 h["Old Price_num"].to_numpy(float),h["New Price_num"].to_numpy(float))
+
+    def add_archive(self,changes,tz=None):
+        """history_archive.read_changes() rows (epoch seconds → naive local time)."""
+        if changes.empty:
+            return
+        tz=tz or datetime.datetime.now().astimezone().tzinfo
+        local=pd.to_datetime(changes["ts"],unit="s",utc=True).dt.tz_convert(tz).dt.tz_localize(None)
+        self.add(changes["sku"].str.lower().to_numpy(),local.to_numpy("datetime64[ns]").astype(np.int64),
+                 changes["old"].to_numpy(float),changes["new"].to_numpy(float))
+
+    def stamp(self,sku):
+        """(points, last time) — changes whenever the SKU's series does."""
+        with self.lock:
+            cur=self.series.get(sku)
+        return (0,0) if cur is None else (len(cur[0]),int(cur[0][-1]))
+
+    def window(self,sku,start=None,end=None,points=300):
+        """(times, prices) within [start, end] (ns), at most `points` long.
+
+        The price in effect at `start` is carried in as the first point."""
+        with self.lock:
+            cur=self.series.get(sku)
+        if cur is None:
+            return np.empty(0,np.int64),np.empty(0)
+        t,p=cur
+        lo=0 if start is None else max(0,int(np.searchsorted(t,start,"right"))-1)
+        hi=len(t) if end is None else int(np.searchsorted(t,end,"right"))
+        t,p=t[lo:hi],p[lo:hi]
+        if start is not None and len(t) and t[0]<start:
+            t=t.copy()
+            t[0]=start
+        return downsample(t,p,points)
+
+def downsample(t,p,points):
+    """Keep the first/last point and each bucket's min and max (in time order)."""
+    n=len(t)
+    if n<=points or points<4:
+        return t,p
+    edges=np.linspace(0,n,points//2+1).astype(int)
+    keep=[0,n-1]
+    for a,b in zip(edges[:-1],edges[1:]):
+        if b>a:
+            seg=p[a:b]
+            keep+=[a+int(np.argmin(seg)),a+int(np.argmax(seg))]
+    idx=np.unique(keep)
+    return t[idx],p[idx]
@@ -0,0 +1,154 @@
+# history_archive.py
+# Columnar archive for price-change history that has aged out of the live
+# `history` worksheet. One directory per local date holds compressed NumPy
+# arrays (np.savez_compressed):
+#
+#   <root>/2026-01-31/changes.npz   sku, ts, old, new          (one row per change)
+#   <root>/2026-01-31/hourly.npz    sku, start, first, last, min, max, changes
+#   <root>/2026-01-31/daily.npz     same columns, one row per SKU for the day
+#   <root>/last_change.npz          sku, ts, old, new          (latest change per SKU)
+#
+# "first" is the price when the bucket opened (old price of its first
+# change), "last" the price it closed at. Writers merge into existing
+# partitions and drop exact duplicates, so re-archiving rows is harmless.
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from price_store import sku_key
+
+DEFAULT_ARCHIVE_DIR = "history_archive"
+ARCHIVE_DIR = os.environ.get("NOON_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR).strip()
+
+LOCAL_TZ = datetime.datetime.now().astimezone().tzinfo
+
+CHANGE_COLUMNS = ["sku", "ts", "old", "new"]
+ROLLUP_COLUMNS = ["sku", "start", "first", "last", "min", "max", "changes"]
+ROLLUPS = {"hourly": "h", "daily": "D"}
+
+
+# ---- file helpers ----
+
+def _save(path, df):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {c: df[c].to_numpy() for c in df.columns}
+    arrays["sku"] = df["sku"].to_numpy(dtype=str)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, path)
+
+
+def _load(path, columns):
+    if not os.path.isfile(path):
+        return pd.DataFrame({c: [] for c in columns})
+    with np.load(path, allow_pickle=False) as data:
+        return pd.DataFrame({c: data[c] for c in columns})
+
+
+def partitions(root=ARCHIVE_DIR):
+    """Archived dates (YYYY-MM-DD), oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isfile(os.path.join(root, d, "changes.npz")))
+
+
+def _local(ts):
+    return pd.to_datetime(ts, unit="s", utc=True).dt.tz_convert(LOCAL_TZ)
+
+
+# ---- writing ----
+
+def rollup(changes, freq):
+    """Per-SKU buckets of `freq` ("h" / "D") with first/last/min/max/changes."""
+    if changes.empty:
+        return pd.DataFrame({c: [] for c in ROLLUP_COLUMNS})
+    df = changes.sort_values("ts", kind="mergesort")
+    start = _local(df["ts"]).dt.floor(freq)
+    df = df.assign(start=start.map(lambda t: t.timestamp()).astype(float),
+                   lo=df[["old", "new"]].min(axis=1), hi=df[["old", "new"]].max(axis=1))
+    g = df.groupby(["sku", "start"], sort=True)
+    out = pd.DataFrame({
+        "first": g["old"].first(),
+        "last": g["new"].last(),
+        "min": g["lo"].min(),
+        "max": g["hi"].max(),
+        "changes": g.size().astype(np.int32),
+    }).reset_index()
+    return out[ROLLUP_COLUMNS]
+
+
+def append_changes(rows, root=ARCHIVE_DIR):
+    """Archive (sku, old, new, ts) tuples; returns how many were new.
+
+    Each touched date partition is rewritten with its hourly and daily
+    rollups, and last_change.npz is updated."""
+    new = pd.DataFrame(
+        [(sku_key(sku), ts, old, new) for sku, old, new, ts in rows if sku_key(sku) and ts],
+        columns=CHANGE_COLUMNS,
+    )
+    if new.empty:
+        return 0
+    new = new.astype({"ts": float, "old": float, "new": float})
+    dates = _local(new["ts"]).dt.strftime("%Y-%m-%d")
+
+    added = 0
+    for date, part in new.groupby(dates):
+        path = os.path.join(root, date, "changes.npz")
+        old = _load(path, CHANGE_COLUMNS)
+        merged = pd.concat([old, part], ignore_index=True).drop_duplicates()
+        merged = merged.sort_values("ts", kind="mergesort").reset_index(drop=True)
+        added += len(merged) - len(old)
+
+        _save(path, merged)
+        for kind, freq in ROLLUPS.items():
+            _save(os.path.join(root, date, f"{kind}.npz"), rollup(merged, freq))
+
+    last_path = os.path.join(root, "last_change.npz")
+    last = pd.concat([_load(last_path, CHANGE_COLUMNS), new], ignore_index=True)
+    last = last.sort_values("ts", kind="mergesort").drop_duplicates("sku", keep="last")
+    _save(last_path, last.reset_index(drop=True))
+    return added
+
+
+# ---- reading ----
+
+def _dates_between(start, end, root):
+    first = None if start is None else datetime.datetime.fromtimestamp(start).strftime("%Y-%m-%d")
+    last = None if end is None else datetime.datetime.fromtimestamp(end).strftime("%Y-%m-%d")
+    return [d for d in partitions(root) if (first is None or d >= first) and (last is None or d <= last)]
+
+
+def _read(name, columns, time_col, start, end, skus, root):
+    frames = [_load(os.path.join(root, d, name), columns) for d in _dates_between(start, end, root)]
+    if not frames:
+        return pd.DataFrame({c: [] for c in columns})
+    df = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        df = df[df[time_col] >= start]
+    if end is not None:
+        df = df[df[time_col] <= end]
+    if skus is not None:
+        df = df[df["sku"].isin([sku_key(s) for s in skus])]
+    return df.reset_index(drop=True)
+
+
+def read_changes(start=None, end=None, skus=None, root=ARCHIVE_DIR):
+    """Archived changes with start <= ts <= end (epoch seconds), oldest first."""
+    return _read("changes.npz", CHANGE_COLUMNS, "ts", start, end, skus, root)
+
+
+def read_rollups(kind="daily", start=None, end=None, skus=None, root=ARCHIVE_DIR):
+    """"hourly" or "daily" buckets whose start falls in [start, end]."""
+    if kind not in ROLLUPS:
+        raise ValueError(f"unknown rollup {kind!r} (expected one of {sorted(ROLLUPS)})")
+    return _read(f"{kind}.npz", ROLLUP_COLUMNS, "start", start, end, skus, root)
+
+
+def last_changes(root=ARCHIVE_DIR):
+    """{sku key: (ts, old, new)} of the latest archived change per SKU."""
+    df = _load(os.path.join(root, "last_change.npz"), CHANGE_COLUMNS)
+    return {s: (t, o, n) for s, t, o, n in zip(df["sku"], df["ts"], df["old"], df["new"])}
@@ -0,0 +1,253 @@
+# metrics.py
+# In-process counters and latency histograms for the scraper, exported in
+# Prometheus text format on a local HTTP port and/or appended as JSON lines
+# to a size-rotated file. Standard library only.
+#
+#   with span("navigate"):           # → noon_stage_seconds{stage="navigate"}
+#       page.goto(url)
+#   inc("noon_fetch_total", path="browser", result="ok")
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HELP = {
+    "noon_stage_seconds": "Duration of one scraper stage.",
+    "noon_fetch_total": "SKU fetches by path and result.",
+    "noon_sheets_calls_total": "Google Sheets requests by operation.",
+    "noon_sheets_retries_total": "Google Sheets requests retried after 429/5xx.",
+    "noon_sheets_failures_total": "Google Sheets requests that failed for good.",
+    "noon_sheet_writes_total": "batch_update flushes by result.",
+    "noon_cycles_total": "Monitor cycles by result.",
+    "noon_cycle_skus_total": "SKUs fetched across all cycles.",
+    "noon_browser_requests_total": "Browser sub-requests by resource filter action and resource type.",
+    "noon_ready_seconds": "Wait for the price to render, by outcome (price / oos / timeout).",
+    "noon_context_recycles_total": "Browser context recycles by reason.",
+}
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+    return "{" + body + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def minus(self, counts, count, total):
+        """This histogram less an earlier state (counts, count, sum)."""
+        out = Histogram(self.buckets)
+        out.counts = [a - b for a, b in zip(self.counts, counts)]
+        out.count = self.count - count
+        out.sum = self.sum - total
+        return out
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    def cumulative(self):
+        out, total = [], 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, n=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def span(self, stage, name="noon_stage_seconds"):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, stage=stage)
+
+    def checkpoint(self):
+        """Opaque copy of the current values, for since()."""
+        with self.lock:
+            return (dict(self.counters),
+                    {k: (list(h.counts), h.count, h.sum) for k, h in self.histograms.items()})
+
+    def since(self, checkpoint):
+        """New Registry holding only what was counted / observed after `checkpoint`."""
+        counters, histograms = checkpoint
+        out = Registry()
+        with self.lock:
+            for key, value in self.counters.items():
+                if value != counters.get(key, 0):
+                    out.counters[key] = value - counters.get(key, 0)
+            for key, hist in self.histograms.items():
+                before = histograms.get(key, ([0] * len(hist.buckets), 0, 0.0))
+                if hist.count != before[1]:
+                    out.histograms[key] = hist.minus(*before)
+        return out
+
+    def counts(self, name, by, **match):
+        """{value of label `by`: total} for counter `name`, over series matching `match`."""
+        want = {k: str(v) for k, v in match.items()}
+        out = {}
+        with self.lock:
+            for (n, labels), value in self.counters.items():
+                labels = dict(labels)
+                if n == name and all(labels.get(k) == v for k, v in want.items()):
+                    out[labels.get(by, "")] = out.get(labels.get(by, ""), 0) + value
+        return out
+
+    def histograms_by(self, name, by):
+        """{value of label `by`: Histogram} for histogram `name`."""
+        with self.lock:
+            return {dict(labels).get(by, ""): h for (n, labels), h in self.histograms.items() if n == name}
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, total in hist.cumulative():
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', str(bound))])} {total}")
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist.count}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON-friendly view: counters as-is, histograms as count/sum/p50/p95/p99."""
+        def key(name, labels):
+            return name + _fmt_labels(labels)
+
+        with self.lock:
+            return {
+                "ts": time.time(),
+                "counters": {key(n, l): v for (n, l), v in sorted(self.counters.items())},
+                "histograms": {
+                    key(n, l): {
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for (n, l), h in sorted(self.histograms.items())
+                },
+            }
+
+
+METRICS = Registry()
+inc = METRICS.inc
+observe = METRICS.observe
+span = METRICS.span
+
+
+def serve(port, registry=METRICS, host="127.0.0.1"):
+    """Expose GET /metrics on a daemon thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            data = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class JsonMetricsFile:
+    """Appends one snapshot per line; rotates to .1 .. .`backups` past `max_bytes`."""
+
+    def __init__(self, path, max_bytes=5 * 2 ** 20, backups=3, registry=METRICS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = max(1, backups)
+        self.registry = registry
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def write(self, **extra):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        snap = self.registry.snapshot()
+        snap.update(extra)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snap, ensure_ascii=False) + "\n")
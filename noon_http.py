@@ -0,0 +1,217 @@
+# noon_http.py
+# HTTP fast path: fetch a Noon product page without a browser and read the
+# price / nudges from the server-rendered HTML or the embedded JSON payload.
+# parse_product_html() is pure so it can be checked offline against the
+# synthetic pages in fixtures/ (hand-written in noon's layout, not saved
+# copies of live pages).
+
+import json
+import re
+import threading
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/119.0.0.0 Safari/537.36"
+)
+
+HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+BLOCK_STATUS = {401, 403, 429, 503}
+BLOCK_MARKERS = re.compile(r"captcha|access denied|request unsuccessful|are you a robot", re.I)
+
+_local = threading.local()
+
+
+def get_session(pool_size=4):
+    """One keep-alive session per thread (requests.Session is not thread-safe)."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(HEADERS)
+        _local.session = session
+    return session
+
+
+def parse_price_text(txt):
+    digits = re.sub(r"[^\d.]", "", str(txt or ""))
+    if not digits:
+        return None
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+class _ProductHTMLParser(HTMLParser):
+    """Collects the same elements the browser path reads:
+    span[data-qa="priceNow"], span.*priceNowText, div.price-now, span.price
+    and every div[class*='nudge'].
+    """
+
+    PRICE_KINDS = ["priceNow", "priceNowText", "price-now", "price"]
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.prices = {}
+        self.nudges = []
+        self.scripts = []
+        self._open = []      # [tag, kind, text parts, depth]
+        self._script = None
+
+    def _price_kind(self, tag, attrs):
+        classes = (attrs.get("class") or "").split()
+        if tag == "span" and attrs.get("data-qa") == "priceNow":
+            return "priceNow"
+        if tag == "span" and any(c.endswith("priceNowText") for c in classes):
+            return "priceNowText"
+        if tag == "div" and "price-now" in classes:
+            return "price-now"
+        if tag == "span" and "price" in classes:
+            return "price"
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        for item in self._open:
+            if item[0] == tag:
+                item[3] += 1
+
+        if tag == "script":
+            self._script = {"type": attrs.get("type", ""), "id": attrs.get("id", ""), "text": []}
+            return
+
+        kind = self._price_kind(tag, attrs)
+        if kind and kind not in self.prices:
+            self._open.append([tag, ("price", kind), [], 0])
+        if tag == "div" and "nudge" in (attrs.get("class") or ""):
+            self._open.append([tag, ("nudge", None), [], 0])
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._script is not None:
+            self.scripts.append(self._script)
+            self._script = None
+            return
+
+        for item in list(self._open):
+            if item[0] != tag:
+                continue
+            if item[3] > 0:
+                item[3] -= 1
+                continue
+            self._open.remove(item)
+            txt = " ".join("".join(item[2]).split())
+            what, kind = item[1]
+            if what == "price":
+                self.prices.setdefault(kind, txt)
+            elif txt:
+                self.nudges.append(txt)
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script["text"].append(data)
+            return
+        for item in self._open:
+            item[2].append(data)
+
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for v in node.values():
+            yield from _walk(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _walk(v)
+
+
+def _price_from_json_ld(scripts):
+    for script in scripts:
+        if script["type"] != "application/ld+json":
+            continue
+        try:
+            data = json.loads("".join(script["text"]))
+        except ValueError:
+            continue
+        for node in _walk(data):
+            offers = node.get("offers")
+            if isinstance(offers, dict):
+                offers = [offers]
+            for offer in offers or []:
+                if isinstance(offer, dict):
+                    price = parse_price_text(offer.get("price") or offer.get("lowPrice"))
+                    if price:
+                        return price
+    return None
+
+
+def _price_from_next_data(scripts):
+    for script in scripts:
+        if script["id"] != "__NEXT_DATA__":
+            continue
+        try:
+            data = json.loads("".join(script["text"]))
+        except ValueError:
+            return None
+        for node in _walk(data):
+            for offer in node.get("offers") or []:
+                if isinstance(offer, dict):
+                    price = parse_price_text(offer.get("sale_price") or offer.get("price"))
+                    if price:
+                        return price
+    return None
+
+
+def parse_product_html(html):
+    """Return (price, nudges) from a product page, price None if not found.
+
+    Rendered price elements win (same order as the browser selectors),
+    then JSON-LD offers, then offers inside the __NEXT_DATA__ payload.
+    """
+    parser = _ProductHTMLParser()
+    parser.feed(html)
+    parser.close()
+
+    price = None
+    for kind in _ProductHTMLParser.PRICE_KINDS:
+        price = parse_price_text(parser.prices.get(kind))
+        if price is not None:
+            break
+    if price is None:
+        price = _price_from_json_ld(parser.scripts)
+    if price is None:
+        price = _price_from_next_data(parser.scripts)
+
+    nudges = " | ".join(parser.nudges) if parser.nudges else "-"
+    return price, nudges
+
+
+def fetch_product_http(url, timeout=15):
+    """Return (price, nudges, status) — status is "ok", "blocked", "no-price" or "error"."""
+    try:
+        resp = get_session().get(url, timeout=timeout)
+    except requests.RequestException:
+        return None, "-", "error"
+
+    if resp.status_code in BLOCK_STATUS:
+        return None, "-", "blocked"
+    if resp.status_code != 200:
+        return None, "-", "error"
+
+    price, nudges = parse_product_html(resp.text)
+    if price is None:
+        if BLOCK_MARKERS.search(resp.text[:5000]):
+            return None, "-", "blocked"
+        return None, "-", "no-price"
+    return price, nudges, "ok"
@@ -0,0 +1,234 @@
+# price_store.py
+# Local SQLite store: the system of record for every price observation.
+# The Google Sheet (cells + history worksheet) is a mirror the scraper
+# exports to; anything that needs "latest price" or "last change" for a
+# SKU can ask this file instead of downloading the whole sheet.
+# The events table is an append-only change feed (monotonic seq) that the
+# dashboard tails instead of polling the sheet.
+# prune() bounds the two per-fetch tables: observations older than
+# NOON_DB_KEEP_DAYS (except each SKU's first, which the scheduler uses)
+# and events older than EVENT_KEEP_DAYS. changes / last_change are the
+# price history itself (one row per change) and are kept.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_FILE = "noon_prices.db"
+DB_FILE = os.environ.get("NOON_DB_FILE", DEFAULT_DB_FILE).strip()
+
+DEFAULT_KEEP_DAYS = 90.0
+KEEP_DAYS = float(os.environ.get("NOON_DB_KEEP_DAYS", DEFAULT_KEEP_DAYS))
+# The feed is tailed live; a dashboard further behind than this re-reads the sheet anyway.
+EVENT_KEEP_DAYS = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id      INTEGER PRIMARY KEY,
+    sku     TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    price   REAL,
+    nudges  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_observations_sku_ts ON observations (sku, ts);
+
+CREATE TABLE IF NOT EXISTS changes (
+    id         INTEGER PRIMARY KEY,
+    sku        TEXT NOT NULL,
+    ts         REAL NOT NULL,
+    old_price  REAL,
+    new_price  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_sku_ts ON changes (sku, ts);
+CREATE INDEX IF NOT EXISTS idx_changes_ts ON changes (ts);
+
+CREATE TABLE IF NOT EXISTS latest (
+    sku     TEXT PRIMARY KEY,
+    ts      REAL NOT NULL,
+    price   REAL,
+    nudges  TEXT
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts    REAL NOT NULL,
+    sku   TEXT NOT NULL,
+    kind  TEXT NOT NULL,
+    old   TEXT,
+    new   TEXT
+);
+
+CREATE TABLE IF NOT EXISTS last_change (
+    sku        TEXT PRIMARY KEY,
+    ts         REAL NOT NULL,
+    old_price  REAL,
+    new_price  REAL
+);
+"""
+
+
+def sku_key(sku):
+    """Store key for a SKU: alphanumerics and dashes, upper-cased."""
+    return re.sub(r"[^A-Za-z0-9\-]", "", str(sku or "").strip()).upper()
+
+
+class PriceStore:
+    """Thin wrapper over one SQLite connection (WAL, so readers never block the scraper)."""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- writes ----
+
+    def record_observation(self, sku, price, nudges, ts=None):
+        """Store one fetch result; returns the previous (price, nudges), or None.
+
+        A "price" / "nudge" event is published in the same transaction when
+        the value differs from the previous observation.
+        """
+        key = sku_key(sku)
+        ts = time.time() if ts is None else ts
+        with self.lock, self.conn:
+            prev = self.conn.execute("SELECT price, nudges FROM latest WHERE sku = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT INTO observations (sku, ts, price, nudges) VALUES (?, ?, ?, ?)",
+                (key, ts, price, nudges),
+            )
+            self.conn.execute(
+                "INSERT INTO latest (sku, ts, price, nudges) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(sku) DO UPDATE SET ts = excluded.ts, price = excluded.price, nudges = excluded.nudges",
+                (key, ts, price, nudges),
+            )
+            if prev:
+                if prev[0] != price:
+                    self._publish(key, "price", prev[0], price, ts)
+                if prev[1] != nudges:
+                    self._publish(key, "nudge", prev[1], nudges, ts)
+        return tuple(prev) if prev else None
+
+    def _publish(self, key, kind, old, new, ts):
+        self.conn.execute(
+            "INSERT INTO events (ts, sku, kind, old, new) VALUES (?, ?, ?, ?, ?)",
+            (ts, key, kind, None if old is None else str(old), None if new is None else str(new)),
+        )
+
+    def record_change(self, sku, old_price, new_price, ts=None):
+        key = sku_key(sku)
+        ts = time.time() if ts is None else ts
+        with self.lock, self.conn:
+            self._insert_change(key, old_price, new_price, ts)
+
+    def _insert_change(self, key, old_price, new_price, ts):
+        self.conn.execute(
+            "INSERT INTO changes (sku, ts, old_price, new_price) VALUES (?, ?, ?, ?)",
+            (key, ts, old_price, new_price),
+        )
+        self.conn.execute(
+            "INSERT INTO last_change (sku, ts, old_price, new_price) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(sku) DO UPDATE SET ts = excluded.ts, old_price = excluded.old_price, "
+            "new_price = excluded.new_price WHERE excluded.ts >= last_change.ts",
+            (key, ts, old_price, new_price),
+        )
+
+    def import_changes(self, rows):
+        """Bulk-load (sku, old_price, new_price, ts) tuples, e.g. from the history sheet."""
+        n = 0
+        with self.lock, self.conn:
+            for sku, old_price, new_price, ts in rows:
+                key = sku_key(sku)
+                if key and ts:
+                    self._insert_change(key, old_price, new_price, ts)
+                    n += 1
+        return n
+
+    # ---- reads ----
+
+    def has_changes(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM changes LIMIT 1").fetchone() is not None
+
+    def latest_prices(self):
+        """[(sku, ts, price, nudges), ...] — the newest observation of every SKU."""
+        with self.lock:
+            return self.conn.execute("SELECT sku, ts, price, nudges FROM latest").fetchall()
+
+    def last_changes(self):
+        """{sku: (ts, old, new)} of every SKU's latest change (same shape as
+        history_archive.last_changes())."""
+        with self.lock:
+            return {sku: (ts, old, new) for sku, ts, old, new in self.conn.execute(
+                "SELECT sku, ts, old_price, new_price FROM last_change"
+            )}
+
+    def change_times(self, since=0.0):
+        """{sku: [ts, ...]} of changes after `since`, each list sorted ascending."""
+        out = {}
+        with self.lock:
+            for key, ts in self.conn.execute(
+                "SELECT sku, ts FROM changes WHERE ts >= ? ORDER BY sku, ts", (since,)
+            ):
+                out.setdefault(key, []).append(ts)
+        return out
+
+    def first_seen(self):
+        """{sku: ts} of each SKU's first recorded observation."""
+        with self.lock:
+            return dict(self.conn.execute("SELECT sku, MIN(ts) FROM observations GROUP BY sku"))
+
+    def changes_since(self, last_id=0, limit=None):
+        """[(id, sku, ts, old, new), ...] with id > last_id, oldest first."""
+        sql = "SELECT id, sku, ts, old_price, new_price FROM changes WHERE id > ? ORDER BY id"
+        args = (last_id,)
+        if limit:
+            sql += " LIMIT ?"
+            args += (limit,)
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    # ---- retention ----
+
+    def prune(self, keep_days=KEEP_DAYS, event_keep_days=EVENT_KEEP_DAYS, now=None):
+        """Drop old observations (keeping each SKU's first) and events; returns (observations, events) removed."""
+        now = time.time() if now is None else now
+        with self.lock, self.conn:
+            obs = self.conn.execute(
+                "DELETE FROM observations WHERE ts < ? "
+                "AND id NOT IN (SELECT MIN(id) FROM observations GROUP BY sku)",
+                (now - keep_days * 86400,),
+            ).rowcount
+            events = self.conn.execute(
+                "DELETE FROM events WHERE ts < ?", (now - event_keep_days * 86400,)
+            ).rowcount
+        return obs, events
+
+    # ---- change feed ----
+
+    def last_seq(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+
+    def events_since(self, seq, limit=5000):
+        """[(seq, ts, sku, kind, old, new), ...] with seq > `seq`, oldest first."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT seq, ts, sku, kind, old, new FROM events WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit),
+            ).fetchall()
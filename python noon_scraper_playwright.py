@@ -8,19 +8,97 @@ import datetime
 import re
 import traceback
 import signal
+import json
+import threading
+import queue
+import heapq
+import cProfile
+import pstats
+import socket
+from urllib.parse import urlparse
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-import gspread
-from google.oauth2.service_account import Credentials
+from gspread.utils import rowcol_to_a1
+
+try:
+    import psutil
+except ImportError:  # memory stats / RSS-based recycling are skipped without it
+    psutil = None
+
+from noon_http import fetch_product_http
+from price_store import PriceStore
+from sheets_gateway import SheetsGateway
+from work_queue import WorkQueue
+import metrics
+from metrics import span, inc
 
 DEFAULT_SPREADSHEET_ID = "1EIgmqX2Ku_0_tfULUc8IfvNELFj96WGz_aLoIekfluk"
 DEFAULT_SHEET_NAME = "noon"
 DEFAULT_INTERVAL_MIN = 5.0
+DEFAULT_CONCURRENCY = 3
+DEFAULT_HOST_DELAY_SEC = 1.0
+DEFAULT_BLOCK_BACKOFF_SEC = 30.0
+DEFAULT_BATCH_ROWS = 50
+DEFAULT_HISTORY_SPOOL = "history_spool.jsonl"
+DEFAULT_HISTORY_FLUSH_ROWS = 100
+DEFAULT_HISTORY_FLUSH_SEC = 60.0
+DEFAULT_BLOCK_TYPES = "image,media,font"
+DEFAULT_BLOCK_DOMAINS = (
+    "google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,"
+    "googleadservices.com,facebook.net,facebook.com,hotjar.com,clarity.ms,criteo.com,"
+    "criteo.net,bat.bing.com,analytics.tiktok.com,sc-static.net,snapchat.com,"
+    "appsflyer.com,branch.io,adjust.com,newrelic.com,nr-data.net,segment.io"
+)
+DEFAULT_ALLOW_DOMAINS = "noon.com,nooncdn.com,noon.partners"
+DEFAULT_READY_TIMEOUT_MS = 10000
+DEFAULT_FETCH_MODE = "browser"
+DEFAULT_BASE_URL = "https://www.noon.com/saudi-en"
+DEFAULT_MAX_INTERVAL_MIN = 240.0
+DEFAULT_OWN_MAX_INTERVAL_MIN = 30.0
+DEFAULT_RECYCLE_NAVS = 200
+DEFAULT_RECYCLE_RSS_MB = 1500
+DEFAULT_METRICS_FILE_MB = 5
+DEFAULT_ROLE = "standalone"
+DEFAULT_LEASE_SEC = 120.0
+DEFAULT_ARCHIVE_EVERY_H = 24.0
 
 SA_FILE_ENV = os.environ.get("NOON_SA_FILE", "").strip()
 SPREADSHEET_ID = os.environ.get("NOON_SPREADSHEET_ID", DEFAULT_SPREADSHEET_ID).strip()
 SHEET_NAME = os.environ.get("NOON_SHEET_NAME", DEFAULT_SHEET_NAME).strip()
 INTERVAL_MIN = float(os.environ.get("NOON_INTERVAL_MIN", DEFAULT_INTERVAL_MIN))
+CONCURRENCY = max(1, int(os.environ.get("NOON_CONCURRENCY", DEFAULT_CONCURRENCY)))
+HOST_DELAY_SEC = float(os.environ.get("NOON_HOST_DELAY_SEC", DEFAULT_HOST_DELAY_SEC))
+BLOCK_BACKOFF_SEC = float(os.environ.get("NOON_BLOCK_BACKOFF_SEC", DEFAULT_BLOCK_BACKOFF_SEC))
+BATCH_ROWS = max(1, int(os.environ.get("NOON_BATCH_ROWS", DEFAULT_BATCH_ROWS)))
+HISTORY_SPOOL = os.environ.get("NOON_HISTORY_SPOOL", DEFAULT_HISTORY_SPOOL).strip()
+HISTORY_FLUSH_ROWS = max(1, int(os.environ.get("NOON_HISTORY_FLUSH_ROWS", DEFAULT_HISTORY_FLUSH_ROWS)))
+HISTORY_FLUSH_SEC = float(os.environ.get("NOON_HISTORY_FLUSH_SEC", DEFAULT_HISTORY_FLUSH_SEC))
+BLOCK_RESOURCES = os.environ.get("NOON_BLOCK_RESOURCES", "1").strip() != "0"
+READY_TIMEOUT_MS = int(os.environ.get("NOON_READY_TIMEOUT_MS", DEFAULT_READY_TIMEOUT_MS))
+FETCH_MODE = os.environ.get("NOON_FETCH_MODE", DEFAULT_FETCH_MODE).strip().lower()
+BASE_URL = os.environ.get("NOON_BASE_URL", DEFAULT_BASE_URL).strip().rstrip("/")
+MAX_INTERVAL_MIN = float(os.environ.get("NOON_MAX_INTERVAL_MIN", DEFAULT_MAX_INTERVAL_MIN))
+OWN_MAX_INTERVAL_MIN = float(os.environ.get("NOON_OWN_MAX_INTERVAL_MIN", DEFAULT_OWN_MAX_INTERVAL_MIN))
+RECYCLE_NAVS = max(0, int(os.environ.get("NOON_RECYCLE_NAVS", DEFAULT_RECYCLE_NAVS)))
+RECYCLE_RSS_MB = max(0, int(os.environ.get("NOON_RECYCLE_RSS_MB", DEFAULT_RECYCLE_RSS_MB)))
+METRICS_PORT = int(os.environ.get("NOON_METRICS_PORT", "0") or 0)
+METRICS_FILE = os.environ.get("NOON_METRICS_FILE", "").strip()
+METRICS_FILE_MB = float(os.environ.get("NOON_METRICS_FILE_MB", DEFAULT_METRICS_FILE_MB))
+PROFILE_DIR = os.environ.get("NOON_PROFILE_DIR", "").strip()
+ROLE = os.environ.get("NOON_ROLE", DEFAULT_ROLE).strip().lower()
+LEASE_SEC = float(os.environ.get("NOON_LEASE_SEC", DEFAULT_LEASE_SEC))
+CLAIM_BATCH = max(1, int(os.environ.get("NOON_CLAIM_BATCH", CONCURRENCY * 2)))
+ARCHIVE_KEEP_DAYS = float(os.environ.get("NOON_ARCHIVE_KEEP_DAYS", "0") or 0)
+ARCHIVE_EVERY_H = float(os.environ.get("NOON_ARCHIVE_EVERY_H", DEFAULT_ARCHIVE_EVERY_H))
+
+
+def env_list(name, default):
+    return [x.strip().lower() for x in os.environ.get(name, default).split(",") if x.strip()]
+
+
+BLOCK_TYPES = set(env_list("NOON_BLOCK_TYPES", DEFAULT_BLOCK_TYPES))
+BLOCK_DOMAINS = env_list("NOON_BLOCK_DOMAINS", DEFAULT_BLOCK_DOMAINS)
+ALLOW_DOMAINS = env_list("NOON_ALLOW_DOMAINS", DEFAULT_ALLOW_DOMAINS)
 
 SKU_COLS = [1, 2, 3, 4, 5, 6]
 PRICE_COLS = [7, 8, 9, 10, 11, 12]
@@ -55,36 +133,189 @@ def find_service_file():
     return None
 
 
-def connect_sheet(sa_file, spreadsheet_id, sheet_name):
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_file(sa_file, scopes=scopes)
-    client = gspread.authorize(creds)
-    ws = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    try:
-        ws_hist = client.open_by_key(spreadsheet_id).worksheet("history")
-    except:
-        ws_hist = client.open_by_key(spreadsheet_id).add_worksheet("history", rows=20000, cols=10)
-        ws_hist.append_row(["SKU", "Old Price", "New Price", "Change", "DateTime"])
+def connect_sheet(sheets, spreadsheet_id, sheet_name):
+    """Worksheet handles from the gateway cache (only the first cycle hits the API)."""
+    with span("connect_sheet"):
+        ws = sheets.worksheet(spreadsheet_id, sheet_name)
+        ws_hist = sheets.worksheet(
+            spreadsheet_id, "history",
+            create=(20000, 10, ["SKU", "Old Price", "New Price", "Change", "DateTime"]),
+        )
     return ws, ws_hist
 
 
-def safe_update(ws, r, c, val):
-    for _ in range(3):
-        try:
-            ws.update_cell(r, c, val)
+def safe_batch_update(sheets, ws, data):
+    # Retries / backoff happen inside the gateway; this only reports the final failure.
+    try:
+        with span("sheets_write"):
+            sheets.call(ws.batch_update, data, value_input_option="USER_ENTERED")
+        inc("noon_sheet_writes_total", result="ok")
+        return True
+    except Exception as e:
+        inc("noon_sheet_writes_total", result="failed")
+        log(f"❌ فشل تحديث {len(data)} خلية في الشيت: {e}")
+        return False
+
+
+def same_cell(old_txt, val):
+    if isinstance(val, (int, float)):
+        return parse_old_price(old_txt) == float(val)
+    return (old_txt or "").strip() == str(val).strip()
+
+
+class CellBatch:
+    """Collects cell writes for a cycle and sends them with one batch_update per chunk.
+
+    `rows` is the get_all_values() snapshot; cells that already hold the
+    value are skipped, and the snapshot is updated after a successful flush.
+    Cells of a failed flush are kept and sent again with the next one.
+    """
+
+    def __init__(self, sheets, ws, rows, chunk_rows=BATCH_ROWS):
+        self.sheets = sheets
+        self.ws = ws
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+        self.cells = {}
+        self.done_rows = 0
+
+    def set(self, r, c, val):
+        if same_cell(self.rows[r - 1][c - 1], val):
+            self.cells.pop((r, c), None)
+            return
+        self.cells[(r, c)] = val
+
+    def row_done(self):
+        self.done_rows += 1
+        if self.done_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        self.done_rows = 0
+        if not self.cells:
+            return True
+        data = [
+            {"range": rowcol_to_a1(r, c), "values": [[val]]}
+            for (r, c), val in sorted(self.cells.items())
+        ]
+        ok = safe_batch_update(self.sheets, self.ws, data)
+        if ok:
+            for (r, c), val in self.cells.items():
+                self.rows[r - 1][c - 1] = str(val)
+            log(f"📝 تم إرسال {len(data)} خلية في طلب واحد.")
+            self.cells = {}
+        return ok
+
+
+class HistorySpool:
+    """Write-ahead spool for history rows.
+
+    Rows are appended to a local JSON-lines file first and pushed to the
+    history sheet with append_rows from a background thread, once
+    `flush_rows` are pending or every `flush_sec` seconds. Entries left
+    in the file by a previous run are replayed on startup; a crash between
+    a successful append_rows and the spool rewrite can duplicate rows,
+    but never loses them. Flushes are serialized by `flush_lock` (held
+    by compact_history too, so nothing is appended while it trims the
+    sheet).
+    """
+
+    def __init__(self, path=HISTORY_SPOOL, flush_rows=HISTORY_FLUSH_ROWS, flush_sec=HISTORY_FLUSH_SEC):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_sec = flush_sec
+        self.lock = threading.Lock()
+        self.flush_lock = threading.RLock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.sheets = None
+        self.ws_hist = None
+        self.pending = self._load()
+        if self.pending:
+            log(f"♻️ استرجاع {len(self.pending)} سجل history غير مُرسل من {self.path}")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return []
+        rows = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    log(f"⚠️ سطر تالف في {self.path} تم تجاهله")
+        return rows
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped = True
+        self.wake.set()
+        self.thread.join(timeout=60)
+        self.flush()
+
+    def attach(self, sheets, ws_hist):
+        self.sheets = sheets
+        self.ws_hist = ws_hist
+        if self.pending:
+            self.wake.set()
+
+    def add(self, row):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.pending.append(row)
+            if len(self.pending) >= self.flush_rows:
+                self.wake.set()
+
+    def _run(self):
+        while not self.stopped:
+            self.wake.wait(self.flush_sec)
+            self.wake.clear()
+            if not self.stopped:
+                self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            # Take the batch out of `pending`: rows added while append_rows
+            # runs land in a fresh list and are what the spool rewrite keeps.
+            with self.lock:
+                if not self.pending or self.ws_hist is None:
+                    return True
+                batch, self.pending = self.pending, []
+
+            try:
+                self.sheets.call(self.ws_hist.append_rows, batch, value_input_option="RAW")
+            except Exception as e:
+                with self.lock:
+                    self.pending = batch + self.pending
+                log(f"⚠️ تعذر إرسال {len(batch)} سجل history (سيُعاد المحاولة لاحقًا): {e}")
+                return False
+
+            with self.lock:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for row in self.pending:
+                        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                os.replace(tmp, self.path)
+            log(f"🗂️ تم إرسال {len(batch)} سجل إلى history.")
             return True
-        except:
-            time.sleep(1)
-    return False
 
 
-def save_history(ws_hist, sku, old_price, new_price):
+def save_history(spool, sku, old_price, new_price):
     diff = ""
     try:
         diff = new_price - (old_price if old_price else 0)
     except:
         diff = ""
-    ws_hist.append_row([sku, old_price, new_price, diff, now_str()])
+    with span("history_save"):
+        spool.add([sku, old_price, new_price, diff, now_str()])
 
 
 def parse_old_price(txt):
@@ -96,12 +327,54 @@ def parse_old_price(txt):
         return None
 
 
+# ==========================================
+# Request filter: only what rendering the price needs goes through
+# ==========================================
+
+def host_matches(host, domains):
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+def route_decision(resource_type, url):
+    """Return True if a request should be aborted.
+
+    Heavy resource types (NOON_BLOCK_TYPES) are dropped everywhere; any
+    other request is dropped only for tracker domains that are not
+    first-party (NOON_ALLOW_DOMAINS).
+    """
+    if resource_type in BLOCK_TYPES:
+        return True
+    host = (urlparse(url).hostname or "").lower()
+    if host_matches(host, ALLOW_DOMAINS):
+        return False
+    return host_matches(host, BLOCK_DOMAINS)
+
+
+def handle_route(route):
+    request = route.request
+    if route_decision(request.resource_type, request.url):
+        inc("noon_browser_requests_total", action="blocked", type=request.resource_type)
+        route.abort()
+    else:
+        inc("noon_browser_requests_total", action="allowed", type=request.resource_type)
+        route.continue_()
+
+
+def install_resource_filter(context):
+    if BLOCK_RESOURCES:
+        context.route("**/*", handle_route)
+
+
+def format_counts(counts):
+    return ", ".join(f"{k}={v}" for k, v in sorted(counts.items(), key=lambda kv: -kv[1])) or "-"
+
+
 # ==========================================
 # 🔥 FIX: Playwright anti-block + disable HTTP2
 # ==========================================
 
-def create_stealth_browser(p):
-    browser = p.chromium.launch(
+def launch_browser(p):
+    return p.chromium.launch(
         headless=True,
         args=[
             "--disable-http2",             # ← حل Noon ERR_HTTP2_PROTOCOL_ERROR
@@ -112,6 +385,9 @@ def create_stealth_browser(p):
         ]
     )
 
+
+def new_stealth_context(browser):
+    """Fresh context + page with the resource filter and webdriver patch installed."""
     context = browser.new_context(
         user_agent=(
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -123,6 +399,7 @@ def create_stealth_browser(p):
         bypass_csp=True,
         ignore_https_errors=True,
     )
+    install_resource_filter(context)
 
     page = context.new_page()
 
@@ -133,121 +410,1001 @@ def create_stealth_browser(p):
         });
     """)
 
+    return context, page
+
+
+def create_stealth_browser(p):
+    browser = launch_browser(p)
+    context, page = new_stealth_context(browser)
     return browser, context, page
 
 
 # ==========================================
 
+def product_url(sku):
+    return f"{BASE_URL}/{sku}/p/"
+
+
+PRICE_SELECTORS = [
+    'span[data-qa="priceNow"]',
+    'span.PriceOfferV2-module-scss-module__dHtRPW__priceNowText',
+    'div.price-now',
+    'span.price'
+]
+
+# Stock-state elements inside the product details (not carousels, variant
+# pickers or banners elsewhere on the page), and the scope to search them in.
+PRODUCT_SCOPE = 'div[data-qa="pdp-details"], div[class*="CoreDetails"], main'
+OOS_SELECTOR = '[data-qa*="out-of-stock"], [data-qa*="outOfStock"], [class*="outOfStock"], [class*="OutOfStock"]'
+
+# Resolves to "price" once a price element holds digits, or "oos" when the
+# product's own stock element (or the page title) says it can't be bought;
+# stays falsy (keeps polling) otherwise. Only textContent of a few elements
+# is read, so a poll never forces a layout of the whole page.
+READY_JS = """
+({selectors, scope, oos}) => {
+    for (const sel of selectors) {
+        const el = document.querySelector(sel);
+        if (el && /\\d/.test(el.textContent || "")) return "price";
+    }
+    if (/page not found/i.test(document.title || "")) return "oos";
+    const root = document.querySelector(scope) || document;
+    for (const el of root.querySelectorAll(oos)) {
+        if (/out of stock|currently unavailable|sold out|غير متوفر|نفدت الكمية/i.test(el.textContent || "")) {
+            return "oos";
+        }
+    }
+    return false;
+}
+"""
+
+NUDGE_SELECTOR = "div[class*='nudge']"
+
+# One round trip: first price selector whose first match holds digits,
+# plus the trimmed text of every nudge element.
+EXTRACT_JS = """
+({selectors, nudge}) => {
+    const out = {price: null, selector: null, nudges: []};
+    for (const sel of selectors) {
+        const el = document.querySelector(sel);
+        const txt = el ? (el.textContent || "").trim() : "";
+        if (/\\d/.test(txt)) {
+            out.price = txt;
+            out.selector = sel;
+            break;
+        }
+    }
+    for (const el of document.querySelectorAll(nudge)) {
+        const txt = (el.textContent || "").trim();
+        if (txt) out.nudges.push(txt);
+    }
+    return out;
+}
+"""
+
+# Per-SKU speed hint for READY_JS only: the selector that held this SKU's
+# price last time is checked first. EXTRACT_JS always keeps the fixed
+# PRICE_SELECTORS priority, so a broad selector that won on one page never
+# outranks span[data-qa="priceNow"] on another.
+SELECTOR_HINTS = {}
+SELECTOR_HINTS_LOCK = threading.Lock()
+
+
+def ready_selectors(sku):
+    with SELECTOR_HINTS_LOCK:
+        hint = SELECTOR_HINTS.get(sku)
+    if hint is None:
+        return PRICE_SELECTORS
+    return [hint] + [sel for sel in PRICE_SELECTORS if sel != hint]
+
+
+def remember_selector(sku, sel):
+    with SELECTOR_HINTS_LOCK:
+        SELECTOR_HINTS[sku] = sel
+
+
+def wait_for_price(page, sku, timeout_ms=READY_TIMEOUT_MS):
+    """Wait until the price is rendered or the page is a dead end.
+
+    Returns (state, seconds waited) where state is "price", "oos" or "timeout".
+    """
+    t0 = time.monotonic()
+    try:
+        arg = {"selectors": ready_selectors(sku), "scope": PRODUCT_SCOPE, "oos": OOS_SELECTOR}
+        handle = page.wait_for_function(READY_JS, arg=arg, polling=100, timeout=timeout_ms)
+        state = handle.json_value()
+    except PlaywrightTimeoutError:
+        state = "timeout"
+    waited = time.monotonic() - t0
+    metrics.observe("noon_ready_seconds", waited, state=state)
+    return state, waited
+
+
+def format_ready_stats(hists):
+    """p50 / p95 (histogram bucket bounds) and outcome counts from {state: Histogram}."""
+    total = metrics.Histogram()
+    for hist in hists.values():
+        total.merge(hist)
+    if not total.count:
+        return "-"
+    states = {state: hist.count for state, hist in hists.items()}
+    return f"p50≤{total.quantile(0.5)}s p95≤{total.quantile(0.95)}s | {format_counts(states)}"
+
+
 def fetch_price_and_nudge(page, sku):
-    url = f"https://www.noon.com/saudi-en/{sku}/p/"
+    url = product_url(sku)
 
     try:
-        page.goto(url, timeout=40000, wait_until="domcontentloaded")
-        page.wait_for_timeout(3000)
+        with span("navigate"):
+            page.goto(url, timeout=40000, wait_until="domcontentloaded")
+        with span("wait_price"):
+            state, waited = wait_for_price(page, sku)
     except Exception as e:
+        inc("noon_fetch_total", path="browser", result="error")
         log(f"⚠️ خطأ أثناء فتح الصفحة للـ SKU {sku}: {e}")
         return None, "-"
 
+    log(f"⏱️ SKU {sku}: {state} بعد {waited:.2f} ث")
+    if state == "oos":
+        inc("noon_fetch_total", path="browser", result="oos")
+        return None, "-"
+
+    try:
+        with span("extract"):
+            data = page.evaluate(EXTRACT_JS, {"selectors": PRICE_SELECTORS, "nudge": NUDGE_SELECTOR})
+    except Exception as e:
+        inc("noon_fetch_total", path="browser", result="error")
+        log(f"⚠️ خطأ أثناء قراءة الصفحة للـ SKU {sku}: {e}")
+        return None, "-"
+
     # ---- Price ----
     price = None
-    selectors = [
-        'span[data-qa="priceNow"]',
-        'span.PriceOfferV2-module-scss-module__dHtRPW__priceNowText',
-        'div.price-now',
-        'span.price'
-    ]
-
-    for sel in selectors:
+    if data.get("selector"):
         try:
-            el = page.locator(sel)
-            if el.count() > 0:
-                txt = el.first.text_content().strip()
-                digits = re.sub(r"[^\d.]", "", txt)
-                if digits:
-                    price = float(digits)
-                    break
-        except:
-            pass
+            price = float(re.sub(r"[^\d.]", "", data["price"]))
+            remember_selector(sku, data["selector"])
+        except ValueError:
+            price = None
 
     # ---- Nudges ----
-    nudges_list = []
-    try:
-        all_nudges = page.locator("div[class*='nudge']")
-        for i in range(all_nudges.count()):
-            txt = all_nudges.nth(i).text_content().strip()
-            if txt:
-                nudges_list.append(txt)
-    except:
-        pass
-
+    nudges_list = data.get("nudges") or []
     nudges = " | ".join(nudges_list) if nudges_list else "-"
+
+    if price is not None:
+        result = "ok"
+    else:
+        result = "timeout" if state == "timeout" else "no_price"
+    inc("noon_fetch_total", path="browser", result=result)
     return price, nudges
 
 
-def monitor_loop(sa_file, spreadsheet_id, sheet_name, interval_min):
+# ==========================================
+# HTTP fast path (NOON_FETCH_MODE=auto / http): plain GET + HTML/JSON parsing,
+# falling back to the browser (auto only) when the page is blocked or has no price
+# ==========================================
+
+def format_fast_path_stats(stats):
+    total = sum(stats.values())
+    if not total:
+        return "-"
+    return f"{stats.get('ok', 0) / total:.0%} من {total} | {format_counts(stats)}"
+
+
+def fetch_sku(slot, sku, throttle=None):
+    """HTTP first in "auto" / "http" mode; the browser (started on demand) otherwise.
+
+    The browser fallback is a second request to the same host, so it takes
+    its own `throttle` slot; a "blocked" answer first pushes the host's next
+    slot out by BLOCK_BACKOFF_SEC for every worker sharing the throttle."""
+    if FETCH_MODE in ("auto", "http"):
+        url = product_url(sku)
+        with span("http"):
+            price, nudges, status = fetch_product_http(url)
+        inc("noon_fetch_total", path="http", result=status.replace("-", "_"))
+        if status == "blocked" and throttle is not None:
+            throttle.backoff(urlparse(url).netloc, BLOCK_BACKOFF_SEC)
+        if status == "ok" or FETCH_MODE == "http":
+            return price, nudges
+        if throttle is not None:
+            throttle.wait(urlparse(url).netloc, idle=slot.prepare)
+            if STOP:
+                return None, "-"
+    return fetch_price_and_nudge(slot.current_page(), sku)
+
+
+# ==========================================
+# Concurrent fetching: N workers, each with its own browser
+# (Playwright sync API objects must stay on the thread that created them)
+# ==========================================
+
+class HostThrottle:
+    """Spaces out navigation starts to the same host by at least `min_gap` seconds.
+
+    `idle`, if given, is called while waiting for the slot (cheap
+    preparation work that would otherwise delay the next fetch).
+    """
+
+    def __init__(self, min_gap):
+        self.min_gap = max(0.0, min_gap)
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host, idle=None):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, 0.0))
+            self.next_slot[host] = slot + self.min_gap
+        if slot > now and idle is not None:
+            idle()
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, host, seconds):
+        """Hold every further request to `host` for `seconds` (e.g. after a block page)."""
+        with self.lock:
+            self.next_slot[host] = max(self.next_slot.get(host, 0.0), time.monotonic() + seconds)
+
+
+class SharedHostThrottle:
+    """HostThrottle kept in the work queue's hosts table, so the gap holds
+    across every NOON_ROLE=worker process on the queue, not per process."""
+
+    def __init__(self, wq, min_gap):
+        self.wq = wq
+        self.min_gap = max(0.0, min_gap)
+
+    def wait(self, host, idle=None):
+        slot = self.wq.host_slot(host, self.min_gap)
+        if slot > time.time() and idle is not None:
+            idle()
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, host, seconds):
+        self.wq.host_backoff(host, seconds)
+
+
+# ==========================================
+# Memory: recycle the page's context before Chromium grows without bound
+# ==========================================
+
+def browser_memory():
+    """(python RSS MB, Chromium RSS MB, Chromium process count), or None without psutil."""
+    if psutil is None:
+        return None
+    me = psutil.Process()
+    chrome_mb, chrome_n = 0.0, 0
+    for child in me.children(recursive=True):
+        try:
+            name = child.name().lower()
+            if "chrom" in name or "headless" in name:
+                chrome_mb += child.memory_info().rss / 2 ** 20
+                chrome_n += 1
+        except psutil.Error:
+            continue
+    return me.memory_info().rss / 2 ** 20, chrome_mb, chrome_n
+
+
+def format_memory(mem):
+    if mem is None:
+        return "غير متاح (psutil غير مثبت)"
+    py_mb, chrome_mb, chrome_n = mem
+    return f"بايثون {py_mb:.0f}MB | Chromium {chrome_mb:.0f}MB في {chrome_n} عملية"
+
+
+class MemoryWatch:
+    """Shared, rate-limited view of Chromium RSS for all workers.
+
+    over_limit() is True when the average RSS per browser is above
+    `limit_mb`; it answers True to one worker at a time (then waits
+    `cooldown` seconds) so the pool doesn't recycle every context at once.
+    """
+
+    def __init__(self, limit_mb, browsers, every=10.0, cooldown=30.0):
+        self.limit_mb = limit_mb
+        self.browsers = max(1, browsers)
+        self.every = every
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.checked = 0.0
+        self.last_claim = 0.0
+        self.per_browser_mb = 0.0
+
+    def over_limit(self):
+        if not self.limit_mb or psutil is None:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self.checked >= self.every:
+                self.checked = now
+                mem = browser_memory()
+                self.per_browser_mb = mem[1] / self.browsers if mem else 0.0
+            if self.per_browser_mb > self.limit_mb and now - self.last_claim >= self.cooldown:
+                self.last_claim = now
+                self.checked = 0.0  # re-measure after the swap
+                return True
+        return False
+
+    def near_limit(self, fraction):
+        """Last measured RSS per browser is above `fraction` of the limit (no new measurement)."""
+        if not self.limit_mb or psutil is None:
+            return False
+        with self.lock:
+            return self.per_browser_mb > self.limit_mb * fraction
+
+
+class BrowserSlot:
+    """A worker's browser: the live page plus a spare context.
+
+    Chromium is started on first use (start()), so a worker that only
+    ever takes the HTTP path never launches one. The page's context is
+    replaced after `max_navs` navigations or when `watch` reports the
+    browsers over their RSS budget. The spare is built from prepare(),
+    which the worker calls while it waits for its host slot, so the swap
+    itself only closes the old context. prepare() only builds it once a
+    recycle is near (SPARE_AHEAD_NAVS before max_navs, or RSS above
+    SPARE_RSS_FRACTION of the limit), so workers don't hold an idle
+    renderer for the whole run.
+    """
+
+    SPARE_AHEAD_NAVS = 5
+    SPARE_RSS_FRACTION = 0.8
+
+    def __init__(self, name, max_navs=RECYCLE_NAVS, watch=None):
+        self.name = name
+        self.max_navs = max_navs
+        self.watch = watch
+        self.pw = None
+        self.browser = None
+        self.spare = None
+        self.context = self.page = self.navs = None
+
+    def start(self):
+        if self.browser is None:
+            if self.pw is None:
+                self.pw = sync_playwright().start()
+            self.browser = launch_browser(self.pw)
+            self.context, self.page, self.navs = self._new()
+            log(f"✅ {self.name}: متصفح Playwright تم تشغيله بدون HTTP2.")
+
+    def _new(self):
+        context, page = new_stealth_context(self.browser)
+        navs = [0]
+        page.on("domcontentloaded", lambda _: navs.__setitem__(0, navs[0] + 1))
+        return context, page, navs
+
+    def recycle_near(self):
+        if self.max_navs and self.navs[0] >= self.max_navs - self.SPARE_AHEAD_NAVS:
+            return True
+        return self.watch is not None and self.watch.near_limit(self.SPARE_RSS_FRACTION)
+
+    def prepare(self, force=False):
+        if self.browser is not None and self.spare is None and (force or self.recycle_near()):
+            self.spare = self._new()
+
+    def current_page(self):
+        """The page to fetch with, recycled first if it is due."""
+        self.start()
+        reason = None
+        if self.max_navs and self.navs[0] >= self.max_navs:
+            reason = "navs"
+        elif self.watch is not None and self.watch.over_limit():
+            reason = "rss"
+        if reason:
+            self.prepare(force=True)
+            old = self.context
+            self.context, self.page, self.navs = self.spare
+            self.spare = None
+            try:
+                old.close()
+            except Exception as e:
+                log(f"⚠️ تعذر إغلاق السياق القديم: {e}")
+            inc("noon_context_recycles_total", reason=reason)
+        return self.page
+
+    def close(self):
+        for obj in [self.context, self.spare[0] if self.spare else None, self.browser]:
+            if obj is not None:
+                try:
+                    obj.close()
+                except Exception:
+                    pass
+        if self.pw is not None:
+            self.pw.stop()
+
+
+class FetchPool:
+    """Runs fetch_sku on `size` worker threads in parallel."""
+
+    def __init__(self, size, host_delay, throttle=None):
+        self.size = size
+        self.throttle = throttle or HostThrottle(host_delay)
+        self.memory = MemoryWatch(RECYCLE_RSS_MB, size)
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.threads = []
+        self.profiles = []
+        self.profiles_lock = threading.Lock()
+
+    def __enter__(self):
+        for n in range(self.size):
+            t = threading.Thread(target=self._worker, args=(n + 1,), daemon=True)
+            t.start()
+            self.threads.append(t)
+        return self
+
+    def __exit__(self, *exc):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join(timeout=60)
+
+    def _worker(self, n):
+        slot = BrowserSlot(f"العامل {n}", watch=self.memory)
+        try:
+            if FETCH_MODE == "browser":
+                slot.start()
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                key, sku = job
+                price, nudges = None, "-"
+                if not STOP:
+                    profile = self._start_profile()
+                    try:
+                        self.throttle.wait(urlparse(product_url(sku)).netloc, idle=slot.prepare)
+                        log(f"📌 فحص SKU: {sku}")
+                        price, nudges = fetch_sku(slot, sku, self.throttle)
+                    except Exception as e:
+                        log(f"⚠️ خطأ غير متوقع للـ SKU {sku}: {e}")
+                    finally:
+                        self._stop_profile(profile)
+                self.results.put((key, sku, price, nudges))
+        except Exception:
+            log(f"❌ العامل {n} توقف:\n{traceback.format_exc()}")
+        finally:
+            slot.close()
+
+    def _start_profile(self):
+        """A cProfile for one job on this worker thread (NOON_PROFILE_DIR only)."""
+        if not PROFILE_DIR:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Python 3.12+ runs one profiler at a time; skip this job
+            return None
+        return profile
+
+    def _stop_profile(self, profile):
+        if profile is not None:
+            profile.disable()
+            with self.profiles_lock:
+                self.profiles.append(profile)
+
+    def pop_profiles(self):
+        """Per-job worker profiles collected since the last call."""
+        with self.profiles_lock:
+            profiles, self.profiles = self.profiles, []
+        return profiles
+
+    def map(self, jobs):
+        """Queue (key, sku) jobs and yield (key, sku, price, nudges) as they finish."""
+        pending = 0
+        for job in jobs:
+            self.jobs.put(job)
+            pending += 1
+
+        while pending:
+            try:
+                result = self.results.get(timeout=1)
+            except queue.Empty:
+                if not any(t.is_alive() for t in self.threads):
+                    log("❌ لا يوجد عمّال متصفح يعملون — تم إلغاء بقية الفحص.")
+                    return
+                continue
+            pending -= 1
+            yield result
+
+
+# ==========================================
+# Sharding (NOON_ROLE): one coordinator owns the sheet and the store and
+# queues due SKUs in work_queue.py; worker processes lease and fetch them
+# ==========================================
+
+class QueueDispatch:
+    """FetchPool stand-in for the coordinator: map() puts the jobs on the
+    shared work queue and yields the results the worker processes write
+    back. Gives up on a cycle when nothing arrives for two lease periods
+    and no worker has checked in; leftovers stay unfetched and the
+    scheduler retries them."""
+
+    def __init__(self, path=None, lease_sec=LEASE_SEC):
+        self.queue = WorkQueue(path) if path else WorkQueue()
+        self.lease_sec = lease_sec
+
+    def __enter__(self):
+        log(f"🧭 منسّق: الفحص يتم عبر طابور العمل {self.queue.path}")
+        return self
+
+    def __exit__(self, *exc):
+        self.queue.close()
+
+    def pop_profiles(self):
+        return []  # fetches run in the worker processes
+
+    def map(self, jobs):
+        jobs = list(jobs)
+        want = {key for key, _ in jobs}
+        added = self.queue.enqueue(jobs)
+        log(f"📤 {added} SKU أُضيفت لطابور العمل ({self.queue.live_workers()} عامل نشط)")
+
+        last_result = time.time()
+        while want and not STOP:
+            got = self.queue.collect()
+            for key, sku, price, nudges in got:
+                # results for keys that are no longer planned are dropped
+                if key in want:
+                    want.discard(key)
+                    yield key, sku, price, nudges
+            if got:
+                last_result = time.time()
+                continue
+            if time.time() - last_result > 2 * self.lease_sec and not self.queue.live_workers():
+                log(f"❌ لا يوجد عمّال نشطون — بقي {len(want)} SKU بدون فحص في هذه الدورة.")
+                break
+            time.sleep(0.5)
+
+        if want:
+            self.queue.withdraw(want)
+
+
+def worker_loop(concurrency=CONCURRENCY, claim_batch=CLAIM_BATCH, lease_sec=LEASE_SEC):
+    """NOON_ROLE=worker: lease SKUs from the work queue, fetch them, write results back."""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    log(f"👷 عامل {owner} — {concurrency} متصفح، دفعات من {claim_batch} SKU.")
+
+    with WorkQueue() as wq, FetchPool(concurrency, HOST_DELAY_SEC, SharedHostThrottle(wq, HOST_DELAY_SEC)) as pool:
+        log(f"📥 طابور العمل: {wq.path}")
+        while not STOP:
+            wq.heartbeat(owner)
+            jobs = wq.claim(owner, claim_batch, lease_sec)
+            if not jobs:
+                time.sleep(2)
+                continue
+
+            left = {key for key, _ in jobs}
+            renewed = time.time()
+            lost = 0
+            for key, sku, price, nudges in pool.map(jobs):
+                left.discard(key)
+                if not wq.complete(owner, key, price, nudges):
+                    lost += 1
+                if left and time.time() - renewed > lease_sec / 3:
+                    wq.renew(owner, left, lease_sec)
+                    renewed = time.time()
+
+            wq.heartbeat(owner, done=len(jobs) - len(left))
+            if lost:
+                log(f"⚠️ {lost} نتيجة أُهملت لأن مهلة الحجز انتهت وأخذها عامل آخر.")
+
+    log("🛑 تم إيقاف العامل.")
+
+
+def normalize_sku(txt):
+    return re.sub(r"[^A-Za-z0-9\-]", "", txt.strip())
+
+
+def plan_cycle(rows):
+    """Group the sheet's SKU cells by product so each SKU is fetched once.
+
+    Returns {key: (sku, [(row, sku_index), ...])}. Keys are the upper-cased
+    normalized SKU; `sku` is its first spelling. Rows of `rows` are padded
+    in place to LAST_UPDATE_COL columns.
+    """
+    plan = {}
+    for r in range(2, len(rows) + 1):
+        row = rows[r - 1]
+        row += [""] * (LAST_UPDATE_COL - len(row))
+
+        for i in range(6):
+            sku = normalize_sku(row[SKU_COLS[i] - 1])
+            if not sku:
+                continue
+
+            plan.setdefault(sku.upper(), (sku, []))[1].append((r, i))
+    return plan
+
+
+def count_row_cells(plan, keys):
+    remaining = {}
+    for key in keys:
+        for r, _ in plan[key][1]:
+            remaining[r] = remaining.get(r, 0) + 1
+    return remaining
+
+
+# ==========================================
+# Adaptive scheduling: volatile SKUs are checked often, stable ones back off
+# ==========================================
+
+def parse_history_time(txt):
+    try:
+        return datetime.datetime.strptime(txt.strip(), "%Y-%m-%d %H:%M:%S").timestamp()
+    except (ValueError, AttributeError):
+        return None
+
+
+def history_sheet_changes(values):
+    """(sku, old, new, ts) tuples from history sheet rows [SKU, Old, New, Change, DateTime]."""
+    for row in values[1:]:
+        if len(row) < 5:
+            continue
+        ts = parse_history_time(row[4])
+        if ts:
+            yield row[0], parse_old_price(row[1]), parse_old_price(row[2]), ts
+
+
+def history_row_key(row):
+    """First five cells with trailing blanks dropped (ws.get trims them, get_all_values pads)."""
+    cells = [str(c) for c in row[:5]]
+    while cells and cells[-1] == "":
+        cells.pop()
+    return tuple(cells)
+
+
+def compact_history(sheets, ws_hist, spool, keep_days):
+    """Move history rows older than `keep_days` into history_archive.py's
+    columnar files, then delete them from the sheet. Returns rows removed.
+
+    Only the leading run of old rows is taken (the sheet is append-only,
+    so that is everything older than the cutoff); the archive is written
+    before the delete, so a failure in between only re-archives rows.
+    The spool's flush lock is held throughout, and rows 2..k+1 are re-read
+    and compared right before a single, unretried delete_rows — a retried
+    delete whose first attempt already landed would drop unarchived rows."""
+    import history_archive  # numpy / pandas are only needed when archiving is on
+
+    with spool.flush_lock:
+        spool.flush()
+        values = sheets.call(ws_hist.get_all_values)
+        cutoff = time.time() - keep_days * 86400
+        k = 0
+        for row in values[1:]:
+            ts = parse_history_time(row[4]) if len(row) > 4 else None
+            if ts is None or ts >= cutoff:
+                break
+            k += 1
+        if not k:
+            return 0
+
+        with span("history_archive"):
+            added = history_archive.append_changes(history_sheet_changes(values[:k + 1]))
+            current = sheets.call(ws_hist.get, f"A2:E{k + 1}")
+            expected = [history_row_key(r) for r in values[1:k + 1]]
+            if [history_row_key(r) for r in current] != expected:
+                log("⚠️ أرشفة history: تغيّرت الصفوف في الشيت منذ القراءة — أُلغي الحذف وسيُعاد لاحقًا.")
+                return 0
+            sheets.call_once(ws_hist.delete_rows, 2, k + 1)
+    log(f"🗄️ أرشفة history: نُقل {k} صف ({added} جديد) إلى {history_archive.ARCHIVE_DIR}، "
+        f"وبقي {len(values) - 1 - k} صف في الشيت.")
+    return k
+
+
+class SkuScheduler:
+    """Priority queue of SKU keys ordered by their next due time.
+
+    A SKU's interval is a tenth of the time since its last price change
+    (or, if it never changed, since it was first observed), tightened to
+    half the average gap between its changes over the last week, and
+    clamped to [min_sec, max_sec]. Our own products (column SKU1) never
+    wait longer than own_max_sec. SKUs seen for the first time are due
+    immediately, and back off gradually as they stay unchanged.
+    """
+
+    RATE_WINDOW_SEC = 7 * 24 * 3600
+
+    def __init__(self, min_sec, max_sec, own_max_sec):
+        self.min_sec = min_sec
+        self.max_sec = max(min_sec, max_sec)
+        self.own_max_sec = max(min_sec, own_max_sec)
+        self.heap = []
+        self.due = {}
+        self.changes = {}
+        self.first_seen = {}
+        self.own = set()
+        self.seeded = False
+
+    def load_changes(self, changes, first_seen=None):
+        """Seed with {key: [change ts, ...]} (sorted), e.g. PriceStore.change_times(),
+        and {key: first observation ts}, e.g. PriceStore.first_seen()."""
+        self.changes = changes
+        self.first_seen = dict(first_seen or {})
+        self.seeded = True
+
+    def record_change(self, key, ts):
+        self.changes.setdefault(key, []).append(ts)
+
+    def sync(self, plan, now):
+        """Track the SKUs currently in the sheet; new ones are due at `now`."""
+        self.own = {key for key, (_, locs) in plan.items() if any(i == 0 for _, i in locs)}
+        for key in plan:
+            if key not in self.due:
+                self._push(key, now)
+        for key in list(self.due):
+            if key not in plan:
+                del self.due[key]
+
+    def _push(self, key, due):
+        self.due[key] = due
+        heapq.heappush(self.heap, (due, key))
+
+    def interval(self, key, now):
+        times = self.changes.get(key)
+        if not times:
+            interval = (now - self.first_seen.get(key, now)) / 10
+        else:
+            interval = (now - times[-1]) / 10
+            recent = [t for t in times if now - t <= self.RATE_WINDOW_SEC]
+            if len(recent) >= 2:
+                interval = min(interval, self.RATE_WINDOW_SEC / len(recent) / 2)
+        if key in self.own:
+            interval = min(interval, self.own_max_sec)
+        return min(self.max_sec, max(self.min_sec, interval))
+
+    def pop_due(self, now):
+        keys = []
+        while self.heap and self.heap[0][0] <= now:
+            due, key = heapq.heappop(self.heap)
+            if self.due.get(key) == due:
+                keys.append(key)
+        return keys
+
+    def reschedule(self, key, now, fetched=True):
+        if key not in self.due:
+            return
+        if fetched:
+            self.first_seen.setdefault(key, now)
+        interval = self.interval(key, now) if fetched else self.min_sec
+        self._push(key, now + interval)
+
+
+# ==========================================
+# Metrics: per-stage spans (metrics.py) exported per cycle
+# ==========================================
+
+def start_metrics():
+    """Start the /metrics endpoint if configured; returns the JSON file writer or None."""
+    if METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT)
+            log(f"📈 مقاييس Prometheus على http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e:
+            log(f"⚠️ تعذر فتح منفذ المقاييس {METRICS_PORT}: {e}")
+    if METRICS_FILE:
+        log(f"📈 المقاييس تُكتب في {METRICS_FILE}")
+        return metrics.JsonMetricsFile(METRICS_FILE, max_bytes=int(METRICS_FILE_MB * 2 ** 20))
+    return None
+
+
+class CycleMetrics:
+    """Total time of one monitor cycle, the registry delta for its log lines
+    (stats()), and a cProfile dump when NOON_PROFILE_DIR is set: the main
+    thread's profile merged with the worker threads' per-job profiles
+    (FetchPool.pop_profiles), where the fetch work actually runs."""
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.t0 = time.perf_counter()
+        self.mark = metrics.METRICS.checkpoint()
+        self.finished = False
+        self.profile = None
+        if PROFILE_DIR:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:  # another profiler is active (Python 3.12+ allows one)
+                self.profile = None
+
+    def stats(self):
+        return metrics.METRICS.since(self.mark)
+
+    def done(self, result, skus=0, profiles=()):
+        if self.finished:
+            return
+        self.finished = True
+        metrics.observe("noon_stage_seconds", time.perf_counter() - self.t0, stage="cycle")
+        inc("noon_cycles_total", result=result)
+        if skus:
+            inc("noon_cycle_skus_total", skus)
+
+        if PROFILE_DIR:
+            if self.profile is not None:
+                self.profile.disable()
+            parts = [p for p in [self.profile, *profiles] if p is not None]
+            if parts:
+                merged = pstats.Stats(parts[0])
+                for part in parts[1:]:
+                    merged.add(part)
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                path = os.path.join(PROFILE_DIR, datetime.datetime.now().strftime("cycle-%Y%m%d-%H%M%S.prof"))
+                merged.dump_stats(path)
+                log(f"🔬 cProfile للدورة ({len(profiles)} فحص من العمّال): {path}")
+
+        if self.writer is not None:
+            try:
+                self.writer.write(cycle=result, skus=skus)
+            except OSError as e:
+                log(f"⚠️ تعذر كتابة ملف المقاييس: {e}")
+
+
+def note_sheets_stats(stats):
+    for op, c in stats.items():
+        inc("noon_sheets_calls_total", c["calls"], op=op)
+        if c["retries"]:
+            inc("noon_sheets_retries_total", c["retries"], op=op)
+        if c["failures"]:
+            inc("noon_sheets_failures_total", c["failures"], op=op)
+
+
+def monitor_loop(sa_file, spreadsheet_id, sheet_name, interval_min, concurrency=CONCURRENCY):
     log("🔔 بدء المراقبة — اضغط Ctrl+C للإيقاف.")
+    log(f"⚙️ عدد العمّال المتوازيين: {concurrency}")
+
+    sched = SkuScheduler(interval_min * 60, MAX_INTERVAL_MIN * 60, OWN_MAX_INTERVAL_MIN * 60)
+    sheets = SheetsGateway.from_service_file(sa_file)
+    metrics_file = start_metrics()
+    archived_at = 0.0
+    pruned_at = 0.0
 
-    with sync_playwright() as p:
-        browser, context, page = create_stealth_browser(p)
-        log("✅ متصفح Playwright تم تشغيله بدون HTTP2.")
+    if ROLE == "coordinator":
+        dispatch = QueueDispatch()
+    else:
+        dispatch = FetchPool(concurrency, HOST_DELAY_SEC)
 
+    with PriceStore() as store, HistorySpool() as spool, dispatch as pool:
         while not STOP:
             log("🔄 بدأ فحص جديد...")
+            cycle = CycleMetrics(metrics_file)
 
             try:
-                ws, ws_hist = connect_sheet(sa_file, spreadsheet_id, sheet_name)
+                ws, ws_hist = connect_sheet(sheets, spreadsheet_id, sheet_name)
+                with span("sheet_read"):
+                    rows = sheets.call(ws.get_all_values)
             except Exception as e:
                 log(f"❌ خطأ الاتصال بالشيت: {e}")
+                cycle.done("sheet_error")
+                sheets.reset()
                 time.sleep(30)
                 continue
 
-            rows = ws.get_all_values()
+            spool.attach(sheets, ws_hist)
+
+            if not sched.seeded:
+                try:
+                    if not store.has_changes():
+                        n = store.import_changes(history_sheet_changes(sheets.call(ws_hist.get_all_values)))
+                        log(f"📥 تم نقل {n} سجل من ورقة history إلى {store.path}")
+                    sched.load_changes(store.change_times(), store.first_seen())
+                    log(f"📈 تم تحميل تاريخ التغييرات لـ {len(sched.changes)} SKU للجدولة.")
+                except Exception as e:
+                    log(f"⚠️ تعذر قراءة history للجدولة: {e}")
+
             if len(rows) < 2:
+                cycle.done("empty")
                 time.sleep(60)
                 continue
 
-            for r in range(2, len(rows) + 1):
-                row = rows[r - 1]
-                row += [""] * (LAST_UPDATE_COL - len(row))
+            plan = plan_cycle(rows)
+            cells = sum(len(locs) for _, locs in plan.values())
+            if cells:
+                log(f"🧮 {cells} خانة SKU → {len(plan)} SKU فريد "
+                    f"(توفير {1 - len(plan) / cells:.0%} من عمليات الفتح)")
 
-                changed = False
+            # One sheet read per interval: take every SKU due within the next
+            # half interval now, rather than waking (and re-reading the whole
+            # sheet) each time a single SKU falls due.
+            now = time.time()
+            sched.sync(plan, now)
+            due = sched.pop_due(now + sched.min_sec / 2)
+            log(f"🗓️ {len(due)} من {len(plan)} SKU مستحقة للفحص الآن.")
 
-                for i in range(6):
-                    sku = row[SKU_COLS[i] - 1].strip()
-                    if not sku:
-                        continue
+            remaining = count_row_cells(plan, due)
+            changed = set()
+            batch = CellBatch(sheets, ws, rows)
+            jobs = [(key, plan[key][0]) for key in due]
+            fetched = 0
+            handled = set()
 
-                    sku = re.sub(r"[^A-Za-z0-9\-]", "", sku)
+            for key, sku, price, nudges in pool.map(jobs):
+                locs = plan[key][1]
+                fetched += 1
 
-                    log(f"📌 فحص SKU: {sku}")
-                    old_price = parse_old_price(row[PRICE_COLS[i] - 1])
+                if price is not None:
+                    prev = store.record_observation(key, price, nudges)
+                    old_price = prev[0] if prev else None
+                    if old_price is None:
+                        r, i = locs[0]
+                        old_price = parse_old_price(rows[r - 1][PRICE_COLS[i] - 1])
 
-                    price, nudges = fetch_price_and_nudge(page, sku)
+                    if old_price not in [None, 0] and price != old_price:
+                        store.record_change(key, old_price, price)
+                        save_history(spool, sku, old_price, price)
+                        sched.record_change(key, time.time())
 
+                for r, i in locs:
                     if price is not None:
-                        if old_price not in [None, 0] and price != old_price:
-                            save_history(ws_hist, sku, old_price, price)
+                        batch.set(r, PRICE_COLS[i], price)
+                        batch.set(r, NUDGE_COLS[i], nudges)
 
-                        safe_update(ws, r, PRICE_COLS[i], price)
-                        safe_update(ws, r, NUDGE_COLS[i], nudges)
+                        changed.add(r)
 
-                        changed = True
+                    remaining[r] -= 1
+                    if remaining[r] == 0:
+                        if r in changed:
+                            batch.set(r, LAST_UPDATE_COL, now_str())
+                            log(f"✔️ تم تحديث الصف {r}")
+                        batch.row_done()
 
-                if changed:
-                    safe_update(ws, r, LAST_UPDATE_COL, now_str())
-                    log(f"✔️ تم تحديث الصف {r}")
+                sched.reschedule(key, time.time(), fetched=price is not None)
+                handled.add(key)
 
-            log(f"⏳ التالي بعد {interval_min} دقيقة...")
-            for _ in range(int(interval_min * 60)):
-                if STOP:
-                    break
+            batch.flush()
+
+            # Jobs cut short by a stop or a dead pool must stay schedulable.
+            for key in due:
+                if key not in handled:
+                    sched.reschedule(key, time.time(), fetched=False)
+
+            # per-cycle lines from what the metrics registry counted since the cycle began
+            stats = cycle.stats()
+            if BLOCK_RESOURCES:
+                log(f"🚫 طلبات محظورة: {format_counts(stats.counts('noon_browser_requests_total', 'type', action='blocked'))}")
+                log(f"🌐 طلبات مسموحة: {format_counts(stats.counts('noon_browser_requests_total', 'type', action='allowed'))}")
+            log(f"⏱️ زمن انتظار السعر: {format_ready_stats(stats.histograms_by('noon_ready_seconds', 'state'))}")
+            if FETCH_MODE in ("auto", "http"):
+                fast = stats.counts("noon_fetch_total", "result", path="http")
+                log(f"⚡ نسبة نجاح المسار السريع (HTTP): {format_fast_path_stats(fast)}")
+            recycles = stats.counts("noon_context_recycles_total", "reason")
+            log(f"🧠 الذاكرة: {format_memory(browser_memory())} | تدوير السياق: {format_counts(recycles)}")
+            sheet_stats, quota_wait = sheets.pop_stats()
+            note_sheets_stats(sheet_stats)
+            log(f"📊 طلبات Sheets (طلبات/إعادة/فشل): {sheets.stats_text(sheet_stats, quota_wait)}")
+            cycle.done("ok", fetched, pool.pop_profiles())
+
+            if ARCHIVE_KEEP_DAYS > 0 and time.time() - archived_at >= ARCHIVE_EVERY_H * 3600:
+                archived_at = time.time()
+                try:
+                    compact_history(sheets, ws_hist, spool, ARCHIVE_KEEP_DAYS)
+                except Exception as e:
+                    log(f"⚠️ تعذرت أرشفة history: {e}")
+
+            if time.time() - pruned_at >= 86400:
+                pruned_at = time.time()
+                try:
+                    obs, events = store.prune()
+                    if obs or events:
+                        log(f"🧹 قاعدة الأسعار: حُذفت {obs} قراءة قديمة و{events} حدث feed.")
+                except Exception as e:
+                    log(f"⚠️ تعذر تنظيف قاعدة الأسعار: {e}")
+
+            wait = interval_min * 60
+            log(f"⏳ التالي بعد {wait / 60:.1f} دقيقة...")
+            end = time.time() + wait
+            while not STOP and time.time() < end:
                 time.sleep(1)
 
-        browser.close()
-        log("🛑 تم الإيقاف بنجاح.")
+    log("🛑 تم الإيقاف بنجاح.")
 
 
 if __name__ == "__main__":
+    if ROLE == "worker":
+        worker_loop()
+        sys.exit(0)
+
     sa_file = find_service_file()
     if not sa_file:
         log("❌ JSON غير موجود.")
@@ -0,0 +1,223 @@
+# sheets_gateway.py
+# One place where the scraper and the dashboard talk to Google Sheets:
+# a persistent authorized client, cached spreadsheet / worksheet handles,
+# a token bucket sized to the per-minute quota and jittered exponential
+# backoff on 429 / 5xx. Every request goes through SheetsGateway.call(),
+# which also counts calls, retries and failures per operation.
+
+import os
+import random
+import threading
+import time
+
+import gspread
+import requests
+from google.oauth2.service_account import Credentials
+
+DEFAULT_SHEETS_PER_MIN = 60
+DEFAULT_SHEETS_RETRIES = 5
+DEFAULT_SHEETS_BACKOFF_SEC = 1.0
+DEFAULT_SHEETS_BACKOFF_MAX_SEC = 64.0
+
+SHEETS_PER_MIN = max(1, int(os.environ.get("NOON_SHEETS_PER_MIN", DEFAULT_SHEETS_PER_MIN)))
+SHEETS_RETRIES = max(0, int(os.environ.get("NOON_SHEETS_RETRIES", DEFAULT_SHEETS_RETRIES)))
+SHEETS_BACKOFF_SEC = float(os.environ.get("NOON_SHEETS_BACKOFF_SEC", DEFAULT_SHEETS_BACKOFF_SEC))
+SHEETS_BACKOFF_MAX_SEC = float(os.environ.get("NOON_SHEETS_BACKOFF_MAX_SEC", DEFAULT_SHEETS_BACKOFF_MAX_SEC))
+
+SCOPES_RW = ["https://www.googleapis.com/auth/spreadsheets"]
+SCOPES_RO = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """`rate` tokens per `per` seconds, at most `burst` saved up; acquire() blocks."""
+
+    def __init__(self, rate, per=60.0, burst=None):
+        self.rate = rate / per
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token; returns the seconds spent waiting for it."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def error_status(exc):
+    """HTTP status of a gspread APIError, or None."""
+    resp = getattr(exc, "response", None)
+    return getattr(resp, "status_code", None)
+
+
+def is_retryable(exc):
+    if isinstance(exc, gspread.exceptions.APIError):
+        return error_status(exc) in RETRY_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_after(exc):
+    """Seconds from a Retry-After header, or None."""
+    resp = getattr(exc, "response", None)
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class SheetsGateway:
+    """Shared Sheets client: rate-limited, retrying, counting.
+
+    `call(fn, *args)` runs one request (e.g. ws.batch_update) after taking
+    a token from the bucket. 429 / 5xx / connection errors are retried up
+    to `retries` times with full-jitter exponential backoff (or the
+    server's Retry-After); anything else, or the last failure, is raised
+    so the caller decides what to do with it.
+    """
+
+    def __init__(self, creds, per_min=SHEETS_PER_MIN, retries=SHEETS_RETRIES,
+                 backoff=SHEETS_BACKOFF_SEC, backoff_max=SHEETS_BACKOFF_MAX_SEC):
+        self.creds = creds
+        self.bucket = TokenBucket(per_min)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        self._client = None
+        self.spreadsheets = {}
+        self.worksheets = {}
+        self.stats = {}
+        self.waited = 0.0
+
+    @classmethod
+    def from_service_file(cls, path, scopes=SCOPES_RW, **kwargs):
+        return cls(Credentials.from_service_account_file(path, scopes=scopes), **kwargs)
+
+    @classmethod
+    def from_service_info(cls, info, scopes=SCOPES_RO, **kwargs):
+        return cls(Credentials.from_service_account_info(info, scopes=scopes), **kwargs)
+
+    # ---- handles ----
+
+    @property
+    def client(self):
+        with self.lock:
+            if self._client is None:
+                self._client = gspread.authorize(self.creds)
+            return self._client
+
+    def spreadsheet(self, spreadsheet_id):
+        with self.lock:
+            sh = self.spreadsheets.get(spreadsheet_id)
+        if sh is None:
+            sh = self.call(self.client.open_by_key, spreadsheet_id)
+            with self.lock:
+                self.spreadsheets[spreadsheet_id] = sh
+        return sh
+
+    def worksheet(self, spreadsheet_id, name, create=None):
+        """Cached worksheet handle. `create` = (rows, cols, header row) adds
+        the worksheet when it does not exist; otherwise WorksheetNotFound
+        is raised."""
+        key = (spreadsheet_id, name)
+        with self.lock:
+            ws = self.worksheets.get(key)
+        if ws is not None:
+            return ws
+
+        sh = self.spreadsheet(spreadsheet_id)
+        try:
+            ws = self.call(sh.worksheet, name)
+        except gspread.exceptions.WorksheetNotFound:
+            if create is None:
+                raise
+            rows, cols, header = create
+            ws = self.call(sh.add_worksheet, name, rows=rows, cols=cols)
+            if header:
+                self.call(ws.append_row, header)
+        with self.lock:
+            self.worksheets[key] = ws
+        return ws
+
+    def reset(self):
+        """Drop the client and every cached handle (next use re-authorizes)."""
+        with self.lock:
+            self._client = None
+            self.spreadsheets.clear()
+            self.worksheets.clear()
+
+    # ---- requests ----
+
+    def _count(self, op, what, n=1):
+        with self.lock:
+            counts = self.stats.setdefault(op, {"calls": 0, "retries": 0, "failures": 0})
+            counts[what] += n
+
+    def _take_token(self, op):
+        waited = self.bucket.acquire()
+        self._count(op, "calls")
+        if waited:
+            with self.lock:
+                self.waited += waited
+
+    def call(self, fn, *args, **kwargs):
+        op = getattr(fn, "__name__", "call")
+        attempt = 0
+        while True:
+            self._take_token(op)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    self._count(op, "failures")
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                attempt += 1
+                self._count(op, "retries")
+                time.sleep(delay)
+
+    def call_once(self, fn, *args, **kwargs):
+        """Rate-limited and counted like call(), but never retried — for
+        requests that are not idempotent (e.g. delete_rows), where a
+        timeout may hide a request the server already applied."""
+        op = getattr(fn, "__name__", "call")
+        self._take_token(op)
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            self._count(op, "failures")
+            raise
+
+    def pop_stats(self):
+        with self.lock:
+            stats, waited = self.stats, self.waited
+            self.stats, self.waited = {}, 0.0
+        return stats, waited
+
+    def stats_text(self, stats=None, waited=None):
+        """One line: "op calls/retries/failures, ..." plus the total rate-limit wait."""
+        if stats is None:
+            with self.lock:
+                stats = {op: dict(c) for op, c in self.stats.items()}
+                waited = self.waited
+        if not stats:
+            return "لا توجد طلبات"
+        parts = [
+            f"{op} {c['calls']}/{c['retries']}/{c['failures']}"
+            for op, c in sorted(stats.items())
+        ]
+        return ", ".join(parts) + f" (انتظار الحصة {waited or 0:.1f}s)"
@@ -4,12 +4,34 @@ import time
 import datetime
 import streamlit as st
 import pandas as pd
+import numpy as np
+import altair as alt
 import gspread
-from google.oauth2.service_account import Credentials
+from gspread.utils import rowcol_to_a1
 import streamlit.components.v1 as components
 import re
 from datetime import datetime
 import html
+import threading
+import hashlib
+from collections import OrderedDict
+from dashboard_data import (clean_sku_text,pad_row,
+    sheet_frame,history_frame,build_sku_index,build_last_changes,SearchIndex,
+    build_sku_locations,store_history_frame,merge_last_changes,apply_events,latest_events,last_changes_table,
+    PriceSeriesCache)
+import history_archive
+from price_store import PriceStore
+from sheets_gateway import SheetsGateway
+
+SPREADSHEET_ID="1EIgmqX2Ku_0_tfULUc8IfvNELFj96WGz_aLoIekfluk"
+CACHE_TTL_SEC=int(os.environ.get("NOON_CACHE_TTL_SEC",15))
+CARD_CACHE_MAX=5000
+CHART_POINTS=300
+CHART_RANGES={"7 أيام":7,"30 يوم":30,"90 يوم":90,"سنة":365,"الكل":None}
+# قاعدة السكرابر المحلية (price_store.py): إن وُجدت تصل التغييرات منها كـ feed
+# ويُعاد تحميل الشيت كاملاً كل RECONCILE_SEC فقط للمطابقة
+FEED_DB=os.environ.get("NOON_DB_FILE","noon_prices.db").strip()
+RECONCILE_SEC=int(os.environ.get("NOON_RECONCILE_SEC",600))
 
 # -------------------------------------------------
 # إعداد الصفحة
@@ -120,94 +142,217 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# -------------------------------------------------
-# تنظيف SKU
-# -------------------------------------------------
-def clean_sku_text(x):
-    if not x:
-        return ""
-    x=str(x).strip()
-    x=re.sub(r"[\u200B-\u200F\u202A-\u202E\uFEFF]","",x)
-    m=re.search(r"\(([A-Za-z0-9]+)\)",x)
-    if m:
-        return m.group(1)
-    parts=re.findall(r"[A-Za-z0-9]{6,}",x)
-    if parts:
-        return max(parts,key=len)
-    return x
-
 # -------------------------------------------------
 # SKU → لينك
 # -------------------------------------------------
-def sku_to_link_html(sku):
-    s=clean_sku_text(sku)
+def sku_link_html(s):
+    """Link for an already-cleaned SKU (the *_clean columns)."""
     url=f"https://www.noon.com/saudi-en/{s}/p/"
     return f'<a href="{url}" target="_blank" style="text-decoration:none;color:#007bff;font-weight:600">{s}</a>'
 
 # -------------------------------------------------
-# Sheet
+# كاش مشترك بين كل الجلسات: عميل واحد + بيانات بعمر TTL
 # -------------------------------------------------
-def load_sheet():
-    creds=Credentials.from_service_account_info(
-        st.secrets["google_service_account"],
-        scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-    )
-    client=gspread.authorize(creds)
-    ws=client.open_by_key("1EIgmqX2Ku_0_tfULUc8IfvNELFj96WGz_aLoIekfluk").worksheet("noon")
-
-    data=ws.get_all_values()
-    df=pd.DataFrame(data[1:],columns=data[0])
-
-    for c in ["SKU1","SKU2","SKU3","SKU4","SKU5","SKU6"]:
-        df[c]=df[c].apply(clean_sku_text)
-
-    return df
+@st.cache_resource
+def cache_stats():
+    return {"lock":threading.Lock(),"calls":{},"misses":{}}
+
+def note_cache(name,kind):
+    stats=cache_stats()
+    with stats["lock"]:
+        stats[kind][name]=stats[kind].get(name,0)+1
+
+def cache_stats_text():
+    stats=cache_stats()
+    with stats["lock"]:
+        lines=[]
+        for name,calls in sorted(stats["calls"].items()):
+            misses=stats["misses"].get(name,0)
+            lines.append(f"{name}: hits {calls-misses} / misses {misses}")
+    return " | ".join(lines)
+
+@st.cache_resource
+def get_sheets():
+    """Shared gateway (sheets_gateway.py): one client, quota bucket and backoff for every session."""
+    return SheetsGateway.from_service_info(st.secrets["google_service_account"])
+
+def get_worksheet(name):
+    return get_sheets().worksheet(SPREADSHEET_ID,name)
 
 # -------------------------------------------------
-# History
+# Change feed
 # -------------------------------------------------
-def load_history():
-    creds=Credentials.from_service_account_info(
-        st.secrets["google_service_account"],
-        scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-    )
-    client=gspread.authorize(creds)
-
-    try:
-        ws=client.open_by_key("1EIgmqX2Ku_0_tfULUc8IfvNELFj96WGz_aLoIekfluk").worksheet("history")
-    except:
-        return pd.DataFrame()
+@st.cache_resource
+def get_feed():
+    """PriceStore on the scraper's database, or None when it isn't on this machine."""
+    if not os.path.isfile(FEED_DB):
+        return None
+    return PriceStore(FEED_DB)
 
-    data=ws.get_all_values()
-    if len(data)<=1: return pd.DataFrame()
+# -------------------------------------------------
+# Sheet
+# -------------------------------------------------
+# الشيت + فهارسه محفوظة مرة واحدة للعملية كلها وتُحدّث كل TTL
+@st.cache_resource
+def sheet_state():
+    return {"lock":threading.Lock(),"checked":0.0,"df":None,"sku_index":{},"search":None,
+            "locations":{},"seq":0,"events":0}
+
+def apply_feed(state,feed):
+    """Applies price/nudge events newer than state["seq"] to a copy of the sheet frame."""
+    events=feed.events_since(state["seq"])
+    if not events:
+        return
+    df,touched=apply_events(state["df"],state["locations"],events)
+    if touched:
+        state["df"]=df
+    state["seq"]=events[-1][0]
+    state["events"]+=len(events)
 
-    df=pd.DataFrame(data[1:],columns=data[0])
-    df["SKU_clean"]=df["SKU"].apply(clean_sku_text)
-    df["SKU_lower"]=df["SKU_clean"].str.lower()
-    df["DateTime"]=pd.to_datetime(df["DateTime"],errors="coerce")
-    return df
+def load_sheet():
+    """Returns (df, sku_index, search_index) — see dashboard_data.build_sku_index / SearchIndex.
+
+    With the feed the full sheet is only re-read every RECONCILE_SEC;
+    in between the frame follows the scraper's events. The scraper writes
+    cells in batches after publishing events, so a re-read sheet can lag
+    the store: each reconcile lays the store's latest observations over it."""
+    note_cache("noon","calls")
+    state=sheet_state()
+    feed=get_feed()
+    ttl=RECONCILE_SEC if feed else CACHE_TTL_SEC
+    with state["lock"]:
+        if state["df"] is None or time.time()-state["checked"]>=ttl:
+            note_cache("noon","misses")
+            # seq قبل القراءة: الأحداث تضع قيمة نهائية، فإعادة تطبيق حدث موجود بالشيت لا تضر
+            seq=feed.last_seq() if feed else 0
+            ws=get_worksheet("noon")
+            df=sheet_frame(get_sheets().call(ws.get_all_values))
+            locations=build_sku_locations(df)
+            if feed:
+                # خلايا لم يكتبها السكرابر بعد (دفعات CellBatch) → آخر قراءة من القاعدة تغلب الشيت
+                df,_=apply_events(df,locations,latest_events(feed.latest_prices()))
+            state.update(df=df,sku_index=build_sku_index(df),search=SearchIndex(df),
+                         locations=locations,seq=seq,checked=time.time())
+        elif feed:
+            apply_feed(state,feed)
+        return state["df"],state["sku_index"],state["search"]
 
 # -------------------------------------------------
-# Price to float
+# History — تحميل تزايدي: ورقة history تكبر بالإضافة فقط،
+# فنحمّل الصفوف الجديدة في آخرها ونضيفها للـ DataFrame الموجود
 # -------------------------------------------------
-def price_to_float(s):
-    if s is None:return None
-    s=str(s).strip().replace(",",".")
-    s=re.sub(r"[^\d\.\-]","",s)
-    try:return float(s)
-    except:return None
+@st.cache_resource
+def history_state():
+    return {"lock":threading.Lock(),"df":pd.DataFrame(),"last":{},"header":None,"rows":0,"tail":None,"checked":0.0,"change_id":0,
+            "series":PriceSeriesCache()}
+
+def reload_history(state,ws):
+    data=get_sheets().call(ws.get_all_values)
+    state["header"]=data[0] if data else None
+    state["rows"]=len(data)
+    state["tail"]=pad_row(data[-1],len(data[0])) if data else None
+    state["df"]=history_frame(data[0],data[1:]) if len(data)>1 else pd.DataFrame()
+
+    # سلاسل الرسوم: الأرشيف (إن وُجد) + الشيت، تُبنى مرة ثم تُحدّث بالإضافة فقط
+    series=PriceSeriesCache()
+    if history_archive.partitions():
+        series.add_archive(history_archive.read_changes())
+    series.add_frame(state["df"])
+    state["series"]=series
+
+def refresh_history(state,ws):
+    header=state["header"]
+    if header is None:
+        reload_history(state,ws)
+        return
+
+    # آخر صف محمّل + الهيدر في طلب واحد؛ إذا تغيّر أي منهما (حذف/تعديل) → تحميل كامل
+    col=re.sub(r"\d","",rowcol_to_a1(1,len(header)))
+    head,tail=get_sheets().call(ws.batch_get,[f"A1:{col}1",f"A{state['rows']}:{col}"])
+    if not head or pad_row(head[0],len(header))!=header or not tail or pad_row(tail[0],len(header))!=state["tail"]:
+        reload_history(state,ws)
+        return
+
+    new_rows=tail[1:]
+    if not new_rows:
+        return
+    new=history_frame(header,new_rows)
+    state["df"]=new if state["df"].empty else pd.concat([state["df"],new],ignore_index=True)
+    state["series"].add_frame(new)
+    state["rows"]+=len(new_rows)
+    state["tail"]=pad_row(new_rows[-1],len(header))
+
+def refresh_history_from_store(state,feed):
+    """Appends the store's changes newer than state["change_id"].
+
+    last_changes starts from the store's last_change table (+ the archive)
+    and is then merged with each batch of new changes, never rebuilt."""
+    first=not state["change_id"]
+    rows=feed.changes_since(state["change_id"])
+    if first:
+        # الجدول يُقرأ بعد changes_since فيشمل كل ما في rows
+        state["last"]=merge_last_changes(load_archive_last(),last_changes_table(feed.last_changes()))
+    if not rows:
+        return
+    new=store_history_frame(rows)
+    state["df"]=new if state["df"].empty else pd.concat([state["df"],new],ignore_index=True)
+    if not first:
+        state["last"]=merge_last_changes(state["last"],build_last_changes(new))
+    state["series"].add_frame(new)
+    state["change_id"]=rows[-1][0]
+
+# أرشيف history (history_archive.py): آخر تغيير للـ SKUs التي خرجت من الشيت
+@st.cache_resource
+def archive_state():
+    return {"lock":threading.Lock(),"mtime":None,"last":{}}
+
+def load_archive_last():
+    path=os.path.join(history_archive.ARCHIVE_DIR,"last_change.npz")
+    if not os.path.isfile(path):
+        return {}
+    state=archive_state()
+    with state["lock"]:
+        mtime=os.path.getmtime(path)
+        if mtime!=state["mtime"]:
+            state["last"]=last_changes_table(history_archive.last_changes())
+            state["mtime"]=mtime
+        return state["last"]
+
+def load_history():
+    """Returns (hist, last_changes, series) — see dashboard_data.build_last_changes / PriceSeriesCache."""
+    note_cache("history","calls")
+    state=history_state()
+    feed=get_feed()
+    with state["lock"]:
+        if feed:
+            # استعلام محلي رخيص → في كل تحديث بدون TTL
+            before=state["df"]
+            refresh_history_from_store(state,feed)
+            if state["df"] is not before:
+                note_cache("history","misses")
+        elif time.time()-state["checked"]>=CACHE_TTL_SEC:
+            note_cache("history","misses")
+            before=state["df"]
+            try:
+                refresh_history(state,get_worksheet("history"))
+            except gspread.exceptions.WorksheetNotFound:
+                state["df"]=pd.DataFrame()
+            if state["df"] is not before:
+                state["last"]=merge_last_changes(load_archive_last(),build_last_changes(state["df"]))
+            state["checked"]=time.time()
+        return state["df"],state["last"],state["series"]
 
 # -------------------------------------------------
 # آخر تغيير
 # -------------------------------------------------
-def get_last_change(hist,sku):
-    if hist.empty:return None
-    s=clean_sku_text(sku).lower()
-    r=hist[hist["SKU_lower"]==s]
-    if r.empty:return None
-    r=r.sort_values("DateTime")
-    last=r.iloc[-1]
-    return {"old":last["Old Price"],"new":last["New Price"],"time":str(last["DateTime"])}
+def get_last_change(last_changes,sku_clean):
+    """Dict lookup in the table from dashboard_data.build_last_changes."""
+    return last_changes.get(sku_clean.lower())
+
+def change_arrow(old_num,new_num):
+    if new_num>old_num:return "🔺"
+    if new_num<old_num:return "🔻"
+    return "➡️"
 
 # -------------------------------------------------
 # نودج
@@ -222,31 +367,164 @@ def format_nudge_html(n):
 # -------------------------------------------------
 # نودج حسب SKU
 # -------------------------------------------------
-def find_nudge_for_sku(row,sku):
-    s=clean_sku_text(sku)
+def find_nudge_for_sku(df,sku_index,sku):
+    hit=sku_index.get(clean_sku_text(sku))
+    if not hit:
+        return ""
+    pos,slot=hit
+    return df.iloc[pos].get(f"Nudge{slot}","")
+
+# -------------------------------------------------
+# كارت المنتج — HTML محفوظ حسب بصمة محتواه (لا يُعاد بناؤه إلا إذا تغيّر)
+# -------------------------------------------------
+@st.cache_resource
+def card_cache():
+    return {"lock":threading.Lock(),"html":OrderedDict()}
+
+def product_card_html(row,last_changes):
+    """Returns (content hash, card html); the html comes from the shared cache when unchanged."""
+    sku=row.get("SKU1_clean","")
+    name=row.get("ProductName","")
+    image=row.get("Image url","").strip()
+    price=row.get("Price1","")
+
+    comps=[]
+    for i in range(2,7):
+        skuX=row.get(f"SKU{i}_clean","")
+        if not skuX:continue
+        ch=get_last_change(last_changes,skuX)
+        comps.append((skuX,row.get(f"Price{i}",""),row.get(f"Nudge{i}",""),
+            ch and (str(ch["old"]),str(ch["new"]),ch["time"],change_arrow(ch["old_num"],ch["new_num"]))))
+
+    key=hashlib.sha1(repr((sku,name,image,price,comps)).encode("utf-8")).hexdigest()
+    cache=card_cache()
+    with cache["lock"]:
+        if key in cache["html"]:
+            cache["html"].move_to_end(key)
+            return key,cache["html"][key]
+
+    card=f"""
+    <div style='
+        border:1px solid #ddd;
+        border-radius:12px;
+        padding:20px;
+        margin-bottom:20px;
+        background:white;
+        direction:rtl;
+    '>
+    """
+
+    card+=f"<h2>🔵 {html.escape(name)} — {sku_link_html(sku)}</h2>"
+
+    if image:
+        card+=f"<img src='{image}' style='max-width:180px;border-radius:8px;margin-bottom:10px;'>"
+
+    card+=f"<div style='font-size:28px;font-weight:700;'>💰 سعر منتجك: {price}</div><hr>"
+
+    # منافسين
+    for skuX,priceX,nudge,ch in comps:
+        nudgeX=format_nudge_html(nudge)
+
+        if ch:
+            old,newc,when,arrow=ch
+            histHtml=f"""
+            🔄 {old} → {newc} {arrow}
+            <br><span style='font-size:13px;color:#888;'>📅 {when}</span>
+            """
+        else:
+            histHtml="<span style='color:#888;'>لا يوجد تاريخ تغييرات</span>"
+
+        card+=f"""
+        <div style='
+            background:#fafafa;
+            padding:12px;
+            margin-bottom:10px;
+            border-radius:10px;
+        '>
+            <b>منافس:</b> {sku_link_html(skuX)}<br>
+            💰 السعر: {priceX}<br>
+            {nudgeX}<br>
+            {histHtml}
+        </div>
+        """
+
+    card+="</div>"
+
+    with cache["lock"]:
+        cache["html"][key]=card
+        while len(cache["html"])>CARD_CACHE_MAX:
+            cache["html"].popitem(last=False)
+    return key,card
+
+# -------------------------------------------------
+# رسم تطور السعر (سعري + المنافسين)
+# -------------------------------------------------
+def chart_start(range_label):
+    days=CHART_RANGES[range_label]
+    return None if days is None else (pd.Timestamp.now()-pd.Timedelta(days=days)).value
+
+def chart_stamp(row,series):
+    """Changes whenever any series drawn in the row's chart does."""
+    return tuple(series.stamp(row.get(f"SKU{i}_clean","").lower()) for i in range(1,7) if row.get(f"SKU{i}_clean",""))
+
+def price_chart(row,series,start):
+    now=pd.Timestamp.now().value
+    frames=[]
     for i in range(1,7):
-        if clean_sku_text(row.get(f"SKU{i}",""))==s:
-            return row.get(f"Nudge{i}","")
-    return ""
+        sku=row.get(f"SKU{i}_clean","")
+        if not sku:continue
+        ts,pr=series.window(sku.lower(),start,now,CHART_POINTS)
+        cur=row.get(f"Price{i}_num")
+        if pd.notna(cur):
+            ts=np.append(ts,now)
+            pr=np.append(pr,cur)
+        if not len(ts):continue
+        frames.append(pd.DataFrame({"time":pd.to_datetime(ts),"price":pr,"sku":"سعري" if i==1 else sku}))
+    if not frames:
+        return None
+    return alt.Chart(pd.concat(frames,ignore_index=True)).mark_line(interpolate="step-after").encode(
+        x=alt.X("time:T",title=None),
+        y=alt.Y("price:Q",title="السعر",scale=alt.Scale(zero=False)),
+        color=alt.Color("sku:N",title=None),
+        tooltip=["sku","price",alt.Tooltip("time:T",format="%Y-%m-%d %H:%M")],
+    ).properties(height=220)
 
 # -------------------------------------------------
 # Sidebar
 # -------------------------------------------------
 refresh=st.sidebar.slider("⏱ تحديث (ثواني)",5,180,15)
-search=st.sidebar.text_input("🔍 بحث SKU")
+search=st.sidebar.text_input("🔍 بحث SKU / اسم المنتج")
+search_mode=st.sidebar.radio("نوع البحث",["يحتوي","يبدأ بـ"],horizontal=True)
+page_size=int(st.sidebar.number_input("📄 منتجات في الصفحة",min_value=5,max_value=200,value=20,step=5))
+page=int(st.sidebar.number_input("📑 الصفحة",min_value=1,value=1,step=1))
+chart_range=st.sidebar.radio("📈 مدة الرسم",list(CHART_RANGES),index=1,horizontal=True)
+
+cache_box=st.sidebar.empty()
+feed_box=st.sidebar.empty()
+sheets_box=st.sidebar.empty()
+updated_box=st.sidebar.empty()
 
 placeholder=st.empty()
 
+# المنتجات: خانة ثابتة لكل كارت في الصفحة، ولا يُرسل الكارت للمتصفح إلا إذا تغيّرت بصمته
+st.subheader("📦 أسعار المنتجات")
+page_info=st.empty()
+cards_box=st.container()
+card_slots=[]
+shown=[]
+
 # -------------------------------------------------
 # LOOP
 # -------------------------------------------------
 while True:
     try:
-        df=load_sheet()
-        hist=load_history()
+        sheet_df,sku_index,search_index=load_sheet()
+        hist,last_changes,series=load_history()
+        df=sheet_df
 
-        if search:
-            df=df[df.apply(lambda r:r.astype(str).str.contains(search,case=False).any(),axis=1)]
+        hits=search_index.search(search,"prefix" if search_mode=="يبدأ بـ" else "substring")
+        if hits is not None:
+            df=df.iloc[hits]
 
         with placeholder.container():
 
@@ -261,11 +539,10 @@ while True:
 
                 for _,r in recent.iterrows():
                     sku=r["SKU"]
-                    sku_clean=clean_sku_text(sku)
+                    sku_clean=r["SKU_clean"]
 
-                    # البحث عن الصف المرتبط
-                    match=df[df.apply(lambda row: sku_clean in
-                        [clean_sku_text(row.get(c,"")) for c in ["SKU1","SKU2","SKU3","SKU4","SKU5","SKU6"]],axis=1)]
+                    # البحث عن الصف المرتبط (فهرس جاهز بدل المرور على كل الصفوف)
+                    hit=sku_index.get(sku_clean)
 
                     product=""
                     price_mine=""
@@ -273,49 +550,47 @@ while True:
                     nudge_html=""
                     competitors_html=""
 
-                    if not match.empty:
-                        row0=match.iloc[0]
+                    if hit:
+                        row0=sheet_df.iloc[hit[0]]
                         product=row0.get("ProductName","")
                         price_mine=row0.get("Price1","")
                         image=row0.get("Image url","").strip()
-                        nudge_html=format_nudge_html(find_nudge_for_sku(row0,sku))
+                        nudge_html=format_nudge_html(find_nudge_for_sku(sheet_df,sku_index,sku_clean))
 
                         # 🔥 منافسين كلهم بالصف
                         for i in range(2,7):
-                            skuX=row0.get(f"SKU{i}","")
+                            skuX=row0.get(f"SKU{i}_clean","")
                             if not skuX:continue
 
                             priceX=row0.get(f"Price{i}","")
-                            ch=get_last_change(hist,skuX)
+                            ch=get_last_change(last_changes,skuX)
                             nudgeX=format_nudge_html(row0.get(f"Nudge{i}",""))
 
-                            line=f"<b>{sku_to_link_html(skuX)}</b> — 💰 {priceX}"
+                            line=f"<b>{sku_link_html(skuX)}</b> — 💰 {priceX}"
 
                             if ch:
                                 o=str(ch["old"])
                                 n1=str(ch["new"])
-                                arrow="➡️"
-                                if price_to_float(n1)>price_to_float(o):arrow="🔺"
-                                if price_to_float(n1)<price_to_float(o):arrow="🔻"
+                                arrow=change_arrow(ch["old_num"],ch["new_num"])
                                 line+=f" | 🔄 {o} → {n1} {arrow}"
 
                             competitors_html+=f"<div class='comp-box'>{line} {nudgeX}</div>"
 
                     old=str(r["Old Price"])
                     new=str(r["New Price"])
-                    of=price_to_float(old)
-                    nf=price_to_float(new)
+                    of=r["Old Price_num"]
+                    nf=r["New Price_num"]
 
                     arrow="➡️"
                     col="#6c757d"
-                    if of is not None and nf is not None:
+                    if pd.notna(of) and pd.notna(nf):
                         if nf>of:
                             arrow="🔺";col="#dc3545"
                         elif nf<of:
                             arrow="🔻";col="#28a745"
 
                     dir="→"
-                    if of is not None and nf is not None and nf<of:
+                    if pd.notna(of) and pd.notna(nf) and nf<of:
                         dir="←"
 
                     img_box=""
@@ -328,10 +603,10 @@ while True:
                         <div class='notify-body'>
 
                             <div class='notify-title'>
-                                {html.escape(product) if product else sku_to_link_html(sku)}
+                                {html.escape(product) if product else sku_link_html(sku_clean)}
                             </div>
 
-                            <div class='notify-sku'>SKU: {sku_to_link_html(sku)}</div>
+                            <div class='notify-sku'>SKU: {sku_link_html(sku_clean)}</div>
 
                             <div class='notify-price' style='color:{col};'>
                                 {old} {dir} {new} {arrow}
@@ -356,78 +631,45 @@ while True:
 
             st.markdown("</div>",unsafe_allow_html=True)
 
-            # ========================
-            # المنتجات
-            # ========================
-            st.subheader("📦 أسعار المنتجات")
-
-            for _,row in df.iterrows():
-                sku=row.get("SKU1","")
-                if not sku: continue
-
-                name=row.get("ProductName","")
-                image=row.get("Image url","").strip()
-                price=row.get("Price1","")
-
-                card=f"""
-                <div style='
-                    border:1px solid #ddd;
-                    border-radius:12px;
-                    padding:20px;
-                    margin-bottom:20px;
-                    background:white;
-                    direction:rtl;
-                '>
-                """
-
-                card+=f"<h2>🔵 {html.escape(name)} — {sku_to_link_html(sku)}</h2>"
-
-                if image:
-                    card+=f"<img src='{image}' style='max-width:180px;border-radius:8px;margin-bottom:10px;'>"
-
-                card+=f"<div style='font-size:28px;font-weight:700;'>💰 سعر منتجك: {price}</div><hr>"
-
-                # منافسين
-                for i in range(2,7):
-                    skuX=row.get(f"SKU{i}","")
-                    if not skuX:continue
-
-                    priceX=row.get(f"Price{i}","")
-                    nudgeX=format_nudge_html(row.get(f"Nudge{i}",""))
-                    ch=get_last_change(hist,skuX)
-
-                    if ch:
-                        old=str(ch["old"])
-                        newc=str(ch["new"])
-                        arrow="➡️"
-                        if price_to_float(newc)>price_to_float(old):arrow="🔺"
-                        if price_to_float(newc)<price_to_float(old):arrow="🔻"
-
-                        histHtml=f"""
-                        🔄 {old} → {newc} {arrow}
-                        <br><span style='font-size:13px;color:#888;'>📅 {ch["time"]}</span>
-                        """
-                    else:
-                        histHtml="<span style='color:#888;'>لا يوجد تاريخ تغييرات</span>"
-
-                    card+=f"""
-                    <div style='
-                        background:#fafafa;
-                        padding:12px;
-                        margin-bottom:10px;
-                        border-radius:10px;
-                    '>
-                        <b>منافس:</b> {sku_to_link_html(skuX)}<br>
-                        💰 السعر: {priceX}<br>
-                        {nudgeX}<br>
-                        {histHtml}
-                    </div>
-                    """
-
-                card+="</div>"
-                st.markdown(card,unsafe_allow_html=True)
-
-        st.sidebar.write("🕒 آخر تحديث:",datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        # ========================
+        # المنتجات (صفحة واحدة فقط)
+        # ========================
+        products=df[df["SKU1_clean"]!=""] if "SKU1_clean" in df else df.iloc[0:0]
+        pages=max(1,-(-len(products)//page_size))
+        current=min(page,pages)
+        page_info.caption(f"صفحة {current} من {pages} — {len(products)} منتج")
+
+        start=(current-1)*page_size
+        since=chart_start(chart_range)
+        for k,(_,row) in enumerate(products.iloc[start:start+page_size].iterrows()):
+            key,card=product_card_html(row,last_changes)
+            key=(key,chart_range,chart_stamp(row,series))
+            if k>=len(card_slots):
+                card_slots.append(cards_box.empty())
+                shown.append(None)
+            if shown[k]!=key:
+                with card_slots[k].container():
+                    st.markdown(card,unsafe_allow_html=True)
+                    with st.expander("📈 تطور السعر"):
+                        chart=price_chart(row,series,since)
+                        if chart is None:
+                            st.caption("لا توجد بيانات أسعار")
+                        else:
+                            st.altair_chart(chart,use_container_width=True)
+                shown[k]=key
+        for k in range(min(page_size,len(products)-start),len(card_slots)):
+            if shown[k] is not None:
+                card_slots[k].empty()
+                shown[k]=None
+
+        updated_box.write("🕒 آخر تحديث: "+datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        cache_box.caption("🗄️ الكاش: "+cache_stats_text())
+        sheets_box.caption("📊 Sheets (طلبات/إعادة/فشل): "+get_sheets().stats_text())
+        feed_state=sheet_state()
+        if get_feed():
+            feed_box.caption(f"📡 feed: seq {feed_state['seq']} — {feed_state['events']} حدث")
+        else:
+            feed_box.caption("📡 feed: غير متاح (الشيت فقط)")
         time.sleep(refresh)
 
     except Exception as e:
@@ -0,0 +1,9 @@
+# Tests import the flat top-level modules (dashboard_data, noon_http, ...)
+# the same way the bench scripts do: from the repository root.
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,83 @@
+# Parity of the vectorized column helpers in dashboard_data.py with the
+# scalar functions they replace: clean_sku_series vs clean_sku_text and
+# price_series vs price_to_float, on hand-picked edge cases and on random
+# cells shaped like the sheet. bench/bench_dashboard.py reuses the cases.
+# Also the store overlay stream.py lays over a freshly reconciled sheet.
+
+import random
+
+import pandas as pd
+
+from dashboard_data import (clean_sku_text, price_to_float, clean_sku_series, price_series,
+                            sheet_frame, build_sku_locations, apply_events, latest_events)
+
+SKU_CASES = [
+    "", "   ", None, "N12345678A", " n12345678a ", "\u200bN12345678A\u200f",
+    "\ufeffN123\u202a45678A", "Earbuds (N12345678A) black", "(abc)", "(ab-c) ZXCVBN123",
+    "Pro Max ABCDEF 123456789", "AAAAAA BBBBBB", "short x1", "ساعة ذكية (N99887766B)",
+    "ساعة N55566677C", "(\u200bQWERTY1)",
+]
+
+PRICE_CASES = [
+    "", None, "149", "149.00", "1,299", "SAR 1,299.50", " 89 ", "-", "-12.5", "1.2.3",
+    "١٢٣", "٤٥.٥", "abc", ".", "1-2", "0",
+]
+
+
+def same(a, b):
+    if a is None or (isinstance(a, float) and a != a):
+        return b is None or (isinstance(b, float) and b != b)
+    return a == b
+
+
+def assert_sku_parity(values):
+    skus = pd.Series(list(values), dtype=object)
+    for raw, vec in zip(skus, clean_sku_series(skus)):
+        assert vec == clean_sku_text(raw), f"clean_sku_series({raw!r}) = {vec!r}"
+    return len(skus)
+
+
+def assert_price_parity(values):
+    prices = pd.Series(list(values), dtype=object)
+    for raw, vec in zip(prices, price_series(prices)):
+        assert same(price_to_float(raw), vec), f"price_series({raw!r}) = {vec!r}"
+    return len(prices)
+
+
+def random_cells(n, seed=1):
+    rnd = random.Random(seed)
+    skus = [rnd.choice(["N{:09d}A", " n{:09d}a ", "Item (N{:09d}B)", "\u200bN{:09d}C"]).format(rnd.randrange(10**9))
+            for _ in range(n)]
+    prices = [rnd.choice(["{:.2f}", "{:,.2f}", "SAR {:.0f}", " {:.1f} "]).format(rnd.uniform(1, 9000))
+              for _ in range(n)]
+    return skus, prices
+
+
+def test_clean_sku_series_edge_cases():
+    assert_sku_parity(SKU_CASES)
+
+
+def test_price_series_edge_cases():
+    assert_price_parity(PRICE_CASES)
+
+
+def test_parity_on_random_cells():
+    skus, prices = random_cells(1000)
+    assert_sku_parity(skus)
+    assert_price_parity(prices)
+
+
+def test_latest_events_override_a_stale_sheet():
+    # the sheet still shows the values from before the scraper's last, unflushed batch
+    data = [
+        ["SKU1", "Price1", "Nudge1", "SKU2", "Price2", "Nudge2"],
+        ["N1A", "100", "-", "N2B", "50", "-"],
+        ["N3C", "70", "-", "n1a", "100", "-"],
+    ]
+    df = sheet_frame(data)
+    latest = [("N1A", 10.0, 95.0, "Only 2 left"), ("N9Z", 10.0, 1.0, "-")]
+    df, touched = apply_events(df, build_sku_locations(df), latest_events(latest))
+    assert touched == 4
+    assert list(df["Price1"]) == ["95", "70"] and list(df["Price2"]) == ["50", "95"]
+    assert list(df["Price1_num"]) == [95.0, 70.0]
+    assert list(df["Nudge1"]) == ["Only 2 left", "-"] and list(df["Nudge2"]) == ["-", "Only 2 left"]
@@ -0,0 +1,32 @@
+# metrics.py: per-cycle deltas (Registry.since) used for the scraper's log lines.
+
+from metrics import Registry
+
+
+def test_since_keeps_only_new_counts():
+    reg = Registry()
+    reg.inc("noon_browser_requests_total", action="blocked", type="image")
+    reg.observe("noon_ready_seconds", 0.3, state="price")
+    mark = reg.checkpoint()
+
+    reg.inc("noon_browser_requests_total", 2, action="blocked", type="image")
+    reg.inc("noon_browser_requests_total", action="allowed", type="script")
+    reg.observe("noon_ready_seconds", 2.0, state="price")
+    reg.observe("noon_ready_seconds", 11.0, state="oos")
+
+    cycle = reg.since(mark)
+    assert cycle.counts("noon_browser_requests_total", "type", action="blocked") == {"image": 2}
+    assert cycle.counts("noon_browser_requests_total", "action") == {"blocked": 2, "allowed": 1}
+    hists = cycle.histograms_by("noon_ready_seconds", "state")
+    assert {state: h.count for state, h in hists.items()} == {"price": 1, "oos": 1}
+    assert hists["price"].quantile(0.5) == 2.5
+    # the registry itself still holds the running totals
+    assert reg.counts("noon_browser_requests_total", "type", action="blocked") == {"image": 3}
+
+
+def test_since_empty_when_nothing_changed():
+    reg = Registry()
+    reg.inc("noon_cycles_total", result="ok")
+    cycle = reg.since(reg.checkpoint())
+    assert cycle.counts("noon_cycles_total", "result") == {}
+    assert cycle.histograms_by("noon_ready_seconds", "state") == {}
@@ -0,0 +1,68 @@
+# noon_http.py against the synthetic pages in fixtures/ (hand-written to
+# follow noon's markup, not saved live pages): the pure parser, and
+# fetch_product_http through a local HTTP server serving the same pages.
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import noon_http
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("product_rendered.html", (139.0, "Sold recently 50+ | Only 3 left in stock")),
+    ("product_json_only.html", (45.5, "-")),
+    ("blocked.html", (None, "-")),
+])
+def test_parse_product_html(name, expected):
+    assert noon_http.parse_product_html(fixture(name)) == expected
+
+
+# path → (status, fixture page)
+ROUTES = {
+    "/ok": (200, "product_rendered.html"),
+    "/captcha": (200, "blocked.html"),
+    "/forbidden": (403, "blocked.html"),
+    "/missing": (404, "blocked.html"),
+}
+
+
+@pytest.fixture(scope="module")
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, name = ROUTES[self.path]
+            body = fixture(name).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/ok", (139.0, "Sold recently 50+ | Only 3 left in stock", "ok")),
+    ("/captcha", (None, "-", "blocked")),
+    ("/forbidden", (None, "-", "blocked")),
+    ("/missing", (None, "-", "error")),
+])
+def test_fetch_product_http(server, path, expected):
+    assert noon_http.fetch_product_http(server + path, timeout=5) == expected
@@ -0,0 +1,27 @@
+# price_store.py: the last_change table the dashboard reads, and retention.
+
+import os
+
+from price_store import PriceStore
+
+
+def test_last_changes_keeps_newest_per_sku(tmp_path):
+    with PriceStore(os.path.join(tmp_path, "p.db")) as store:
+        store.import_changes([("n1a", 10.0, 12.0, 200.0), ("N1A", 9.0, 10.0, 100.0), ("N2B", 5.0, 4.0, 150.0)])
+        store.record_change("N2B", 4.0, 6.0, ts=300.0)
+        assert store.last_changes() == {"N1A": (200.0, 10.0, 12.0), "N2B": (300.0, 4.0, 6.0)}
+
+
+def test_prune_keeps_first_observation_and_recent_rows(tmp_path):
+    day = 86400.0
+    with PriceStore(os.path.join(tmp_path, "p.db")) as store:
+        for i in range(5):
+            store.record_observation("N1A", 10.0 + i, "-", ts=i * day)
+        store.record_observation("N2B", 7.0, "-", ts=4 * day)
+        assert store.first_seen() == {"N1A": 0.0, "N2B": 4 * day}
+
+        obs, events = store.prune(keep_days=2, event_keep_days=1, now=5 * day)
+        # N1A: days 1 and 2 go (day 0 is its first observation); events: days 1..3 go
+        assert (obs, events) == (2, 3)
+        assert store.first_seen() == {"N1A": 0.0, "N2B": 4 * day}
+        assert [e[2:] for e in store.events_since(0)] == [("N1A", "price", "13.0", "14.0")]
@@ -0,0 +1,37 @@
+# work_queue.py: leases, and per-host pacing shared between connections
+# (each WorkQueue stands in for one worker process on the same file).
+
+import os
+
+from work_queue import WorkQueue
+
+
+def test_host_slots_are_spaced_across_connections(tmp_path):
+    path = os.path.join(tmp_path, "q.db")
+    with WorkQueue(path) as a, WorkQueue(path) as b:
+        slots = [q.host_slot("noon.com", 1.0, now=100.0) for q in (a, b, a, b)]
+        assert slots == [100.0, 101.0, 102.0, 103.0]
+        assert a.host_slot("other.com", 1.0, now=100.0) == 100.0
+        # an idle host starts at `now`, not at the stale reservation
+        assert b.host_slot("noon.com", 1.0, now=500.0) == 500.0
+
+
+def test_host_backoff_delays_every_connection(tmp_path):
+    path = os.path.join(tmp_path, "q.db")
+    with WorkQueue(path) as a, WorkQueue(path) as b:
+        a.host_backoff("noon.com", 30.0, now=100.0)
+        assert b.host_slot("noon.com", 1.0, now=101.0) == 130.0
+        # a shorter backoff never pulls the slot earlier
+        b.host_backoff("noon.com", 5.0, now=101.0)
+        assert a.host_slot("noon.com", 1.0, now=101.0) == 131.0
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    with WorkQueue(os.path.join(tmp_path, "q.db")) as q:
+        q.enqueue([("k1", "N1")], now=0.0)
+        assert q.claim("w1", 10, lease_sec=60, now=0.0) == [("k1", "N1")]
+        assert q.claim("w2", 10, lease_sec=60, now=30.0) == []
+        assert q.claim("w2", 10, lease_sec=60, now=61.0) == [("k1", "N1")]
+        assert not q.complete("w1", "k1", 10.0, "-", now=62.0)
+        assert q.complete("w2", "k1", 10.0, "-", now=62.0)
+        assert q.collect() == [("k1", "N1", 10.0, "-")]
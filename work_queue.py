@@ -0,0 +1,196 @@
+# work_queue.py
+# Shared SKU work queue for running several scraper processes at once.
+# The coordinator (the only process that touches the Google Sheet and the
+# price store) enqueues the SKUs that are due; worker processes claim
+# them under a time-limited lease, fetch them with their own browsers and
+# write the result back. A worker that dies stops renewing its leases, so
+# its items become claimable again once the lease expires.
+# The same file paces requests per host across all workers (hosts table),
+# so NOON_HOST_DELAY_SEC holds for the whole fleet, not per process.
+# SQLite in WAL mode, so the file must be on a local disk shared by all
+# processes (not a network share).
+
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_QUEUE_FILE = "noon_queue.db"
+QUEUE_FILE = os.environ.get("NOON_QUEUE_FILE", DEFAULT_QUEUE_FILE).strip()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work (
+    key          TEXT PRIMARY KEY,
+    sku          TEXT NOT NULL,
+    state        TEXT NOT NULL DEFAULT 'queued',   -- queued | leased | done
+    enqueued     REAL NOT NULL,
+    owner        TEXT,
+    lease_until  REAL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    price        REAL,
+    nudges       TEXT,
+    done_ts      REAL
+);
+CREATE INDEX IF NOT EXISTS idx_work_state ON work (state, lease_until);
+
+CREATE TABLE IF NOT EXISTS workers (
+    owner      TEXT PRIMARY KEY,
+    last_seen  REAL NOT NULL,
+    done       INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS hosts (
+    host       TEXT PRIMARY KEY,
+    next_slot  REAL NOT NULL
+);
+"""
+
+
+class WorkQueue:
+    """Leased work items in one SQLite file; safe across threads and processes."""
+
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _tx(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE, so claims never interleave."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    # ---- coordinator ----
+
+    def enqueue(self, items, now=None):
+        """Add (key, sku) items; keys already queued, leased or awaiting collection are left alone."""
+        now = time.time() if now is None else now
+        return self._tx(lambda c: c.executemany(
+            "INSERT OR IGNORE INTO work (key, sku, enqueued) VALUES (?, ?, ?)",
+            [(key, sku, now) for key, sku in items],
+        ).rowcount)
+
+    def collect(self, limit=500):
+        """Remove and return finished items as [(key, sku, price, nudges), ...]."""
+        def take(c):
+            rows = c.execute(
+                "SELECT key, sku, price, nudges FROM work WHERE state = 'done' ORDER BY done_ts LIMIT ?",
+                (limit,),
+            ).fetchall()
+            c.executemany("DELETE FROM work WHERE key = ?", [(r[0],) for r in rows])
+            return rows
+        return self._tx(take)
+
+    def withdraw(self, keys):
+        """Drop items that are still queued (e.g. when the coordinator stops)."""
+        return self._tx(lambda c: c.executemany(
+            "DELETE FROM work WHERE key = ? AND state = 'queued'", [(k,) for k in keys],
+        ).rowcount)
+
+    def counts(self, now=None):
+        """{"queued", "leased", "expired", "done"} item counts."""
+        now = time.time() if now is None else now
+        out = {"queued": 0, "leased": 0, "expired": 0, "done": 0}
+        with self.lock:
+            for state, expired, n in self.conn.execute(
+                "SELECT state, state = 'leased' AND lease_until < ?, COUNT(*) FROM work GROUP BY 1, 2", (now,)
+            ):
+                out["expired" if expired else state] += n
+        return out
+
+    def live_workers(self, within=60.0, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE last_seen >= ?", (now - within,)
+            ).fetchone()[0]
+
+    # ---- workers ----
+
+    def heartbeat(self, owner, done=0, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO workers (owner, last_seen, done) VALUES (?, ?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET last_seen = excluded.last_seen, done = done + excluded.done",
+                (owner, now, done),
+            )
+
+    def claim(self, owner, n, lease_sec, now=None):
+        """Lease up to n items (queued first, then expired leases); returns [(key, sku), ...]."""
+        now = time.time() if now is None else now
+
+        def take(c):
+            rows = c.execute(
+                "SELECT key, sku FROM work WHERE state = 'queued' "
+                "OR (state = 'leased' AND lease_until < ?) ORDER BY enqueued LIMIT ?",
+                (now, n),
+            ).fetchall()
+            c.executemany(
+                "UPDATE work SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 WHERE key = ?",
+                [(owner, now + lease_sec, key) for key, _ in rows],
+            )
+            return rows
+        return self._tx(take)
+
+    def renew(self, owner, keys, lease_sec, now=None):
+        now = time.time() if now is None else now
+        return self._tx(lambda c: c.executemany(
+            "UPDATE work SET lease_until = ? WHERE key = ? AND owner = ? AND state = 'leased'",
+            [(now + lease_sec, k, owner) for k in keys],
+        ).rowcount)
+
+    def complete(self, owner, key, price, nudges, now=None):
+        """Store a result; False if the lease was lost to another worker meanwhile."""
+        now = time.time() if now is None else now
+        return self._tx(lambda c: c.execute(
+            "UPDATE work SET state = 'done', price = ?, nudges = ?, done_ts = ?, lease_until = NULL "
+            "WHERE key = ? AND owner = ? AND state = 'leased'",
+            (price, nudges, now, key, owner),
+        ).rowcount) == 1
+
+    # ---- per-host pacing (all processes) ----
+
+    def host_slot(self, host, min_gap, now=None):
+        """Reserve the next request start for `host`: at least `min_gap` seconds
+        after the previous reservation by any process. Returns it (epoch seconds)."""
+        now = time.time() if now is None else now
+
+        def take(c):
+            row = c.execute("SELECT next_slot FROM hosts WHERE host = ?", (host,)).fetchone()
+            slot = max(now, row[0] if row else 0.0)
+            c.execute(
+                "INSERT INTO hosts (host, next_slot) VALUES (?, ?) "
+                "ON CONFLICT(host) DO UPDATE SET next_slot = excluded.next_slot",
+                (host, slot + min_gap),
+            )
+            return slot
+        return self._tx(take)
+
+    def host_backoff(self, host, seconds, now=None):
+        """Push every process's next request to `host` at least `seconds` out."""
+        now = time.time() if now is None else now
+        self._tx(lambda c: c.execute(
+            "INSERT INTO hosts (host, next_slot) VALUES (?, ?) "
+            "ON CONFLICT(host) DO UPDATE SET next_slot = MAX(next_slot, excluded.next_slot)",
+            (host, now + seconds),
+        ))